@@ -0,0 +1,114 @@
+import atexit
+import os
+import threading
+from os import environ
+from pymongo import MongoClient
+from sqlalchemy import create_engine, event, text
+
+# Pool settings, shared by all connections of a process
+MONGO_MAX_POOL_SIZE = int(environ.get('mongo_max_pool_size', 20))
+MONGO_MIN_POOL_SIZE = int(environ.get('mongo_min_pool_size', 0))
+MONGO_MAX_IDLE_TIME_MS = 5 * 60 * 1000
+SQLITE_POOL_SIZE = int(environ.get('sqlite_pool_size', 5))
+
+_lock = threading.Lock()
+_mongo_client = None
+_mongo_client_pid = None
+_sqlite_engine = None
+_sqlite_engine_pid = None
+
+
+def get_mongo_client():
+    """Returns the process-wide MongoDB client, created on first use.
+    The client keeps its TLS connections open in a pool, so they are only set up once per process.
+    Forked processes (e.g. crawl workers) get their own client as pools must not be shared across forks.
+
+    Returns:
+        pymongo.MongoClient: MongoDB client
+    """
+    global _mongo_client, _mongo_client_pid
+    with _lock:
+        if _mongo_client is None or _mongo_client_pid != os.getpid():
+            _mongo_client = MongoClient(environ.get('database_uri'),
+                                        tls=True,
+                                        tlsCertificateKeyFile=environ.get('database_cert_path'),
+                                        maxPoolSize=MONGO_MAX_POOL_SIZE,
+                                        minPoolSize=MONGO_MIN_POOL_SIZE,
+                                        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                                        connect=False)
+            _mongo_client_pid = os.getpid()
+
+    return _mongo_client
+
+def get_movie_collection():
+    # Connect to MovieReleases mongoDB
+    return get_mongo_client()['movieReleases']['movies']
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Write-ahead log and relaxed syncing for fast bulk writes
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-64000')
+    cursor.close()
+
+def get_sqlite_engine():
+    """Returns the process-wide SQLAlchemy engine of the top movies database, created on first use.
+    Pooled connections are checked before they are handed out.
+
+    Returns:
+        sqlalchemy.engine.Engine: SQLite engine
+    """
+    global _sqlite_engine, _sqlite_engine_pid
+    with _lock:
+        if _sqlite_engine is not None and _sqlite_engine_pid != os.getpid():
+            # Drop connections inherited from the parent process without closing them
+            _sqlite_engine.dispose(close=False)
+            _sqlite_engine_pid = os.getpid()
+        if _sqlite_engine is None:
+            database_file = environ.get('database_file', 'top_movies.db')
+            _sqlite_engine = create_engine(f'sqlite:///{database_file}',
+                                           echo=False,
+                                           pool_size=SQLITE_POOL_SIZE,
+                                           pool_pre_ping=True)
+            event.listen(_sqlite_engine, 'connect', _set_sqlite_pragmas)
+            _sqlite_engine_pid = os.getpid()
+
+    return _sqlite_engine
+
+def check_health():
+    """Checks whether both stores respond
+
+    Returns:
+        dict: Dictionary with the store as key and True if it responded as value
+    """
+    health = {}
+    try:
+        get_mongo_client().admin.command('ping')
+        health['mongo'] = True
+    except Exception:
+        health['mongo'] = False
+    try:
+        with get_sqlite_engine().connect() as connection:
+            connection.execute(text('SELECT 1'))
+        health['sqlite'] = True
+    except Exception:
+        health['sqlite'] = False
+
+    return health
+
+def close_all():
+    """Closes the MongoDB client and the SQLite connection pool"""
+    global _mongo_client, _sqlite_engine
+    with _lock:
+        if _mongo_client is not None and _mongo_client_pid == os.getpid():
+            _mongo_client.close()
+        if _sqlite_engine is not None:
+            _sqlite_engine.dispose()
+        _mongo_client = None
+        _sqlite_engine = None
+
+    return
+
+atexit.register(close_all)
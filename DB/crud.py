@@ -1,48 +1,111 @@
 # Function to retrieve all movies
-from sqlalchemy import create_engine, Column, Integer, String, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
 from DB.schema import Movies
+from DB import connections
 import pandas as pd
-from os import environ
 
-# Define the database file path
-database_file = environ.get('database_file')
-
-# Create the SQLAlchemy engine
-conn = f'sqlite:///{database_file}'
-engine = create_engine(conn, echo=True)
-
-# Create a session factory
-Session = sessionmaker(bind=engine)
+# Columns written on upload and columns updated if the movie is already stored
+upload_columns = ['date_added', 'name', 'release_year', 'imdb_link', 'imdb_rating', 'runtime', 'flatrate_link',
+                  'num_ratings', 'justwatch_link', 'meta_provider', 'meta_country']
+natural_key_columns = ['imdb_link', 'meta_provider', 'meta_country']
+update_columns = ['name', 'release_year', 'imdb_rating', 'runtime', 'flatrate_link', 'num_ratings', 'justwatch_link']
 
 def get_all_movies():
-    movies = pd.read_sql_table('topMovies', conn)
+    movies = pd.read_sql_table('topMovies', connections.get_sqlite_engine())
     return movies
 
 def query_db(query):
-    result = pd.read_sql_query(query, conn)
+    result = pd.read_sql_query(query, connections.get_sqlite_engine())
     return result
 
+def load_known_movie_links(providers, countries):
+    """Loads the justwatch links of the stored movies, so they are not scraped again
+
+    Args:
+        providers (list): Streaming providers
+        countries (list): Countries
+
+    Returns:
+        set: Set of (justwatch link, provider, country) tuples
+    """
+    statement = (select(Movies.justwatch_link, Movies.meta_provider, Movies.meta_country)
+                 .where(Movies.meta_provider.in_(providers),
+                        Movies.meta_country.in_(countries),
+                        Movies.justwatch_link.is_not(None)))
+    with connections.get_sqlite_engine().connect() as connection:
+        known_links = {tuple(row) for row in connection.execute(statement)}
+    
+    return known_links
+
+def get_unsent_movies(provider, limit, country=None, min_rating=None):
+    """Gets the oldest movies of a provider that have not been sent yet
+
+    Args:
+        provider (str): Streaming provider
+        limit (int): Maximum number of movies
+        country (str, optional): Only movies of this country
+        min_rating (float, optional): Minimum imdb rating
+
+    Returns:
+        pd.DataFrame: Movies sorted by date added
+    """
+    statement = (select(Movies.__table__)
+                 .where(Movies.meta_provider == provider, Movies.sent == False))
+    if country is not None:
+        statement = statement.where(Movies.meta_country == country)
+    if min_rating:
+        statement = statement.where(Movies.imdb_rating >= min_rating)
+    statement = statement.order_by(Movies.date_added).limit(limit)
+    movies = pd.read_sql_query(statement, connections.get_sqlite_engine())
+    return movies
+
+def mark_movies_as_sent(movie_ids):
+    """Marks movies as sent in one update
+
+    Args:
+        movie_ids (list): Ids of the movies
+
+    Returns:
+        int: Number of updated movies
+    """
+    movie_ids = [int(movie_id) for movie_id in movie_ids]
+    if not movie_ids:
+        return 0
+    
+    statement = update(Movies.__table__).where(Movies.id.in_(movie_ids)).values(sent=True)
+    with connections.get_sqlite_engine().begin() as connection:
+        result = connection.execute(statement)
+    
+    return result.rowcount
+
 # function to upload movies from df
 def upload_movies_from_dataframe(df):
-    session = Session()
-    movies = []
-    for i, row in df.iterrows():
-        movie = Movies(
-            date_added=row['date_added'],
-            name=row['name'],
-            release_year=row['release_year'],
-            imdb_link=row['imdb_link'],
-            imdb_rating=row['imdb_rating'],
-            runtime=row['runtime'],
-            flatrate_link=row['flatrate_link'],
-            num_ratings=row['num_ratings'],
-            meta_provider=row['meta_provider'],
-            meta_country=row['meta_country'],
-            sent=False
-        )
-        movies.append(movie)
-    session.add_all(movies)
-    session.commit()
-    session.close()
\ No newline at end of file
+    """Upserts movies from a dataframe in one transaction. Movies already stored (same imdb link,
+    provider and country) keep their date added and sent flag, the other columns are updated.
+
+    Args:
+        df (pd.DataFrame): Movie dataframe
+
+    Returns:
+        int: Number of uploaded rows
+    """
+    if df.empty:
+        return 0
+    
+    # Build rows from the column arrays, missing values are stored as null
+    upload_df = df[upload_columns].astype(object)
+    upload_df = upload_df.where(upload_df.notna(), None)
+    rows = [dict(zip(upload_columns, values)) for values in zip(*(upload_df[column].tolist() for column in upload_columns))]
+    for row in rows:
+        row['sent'] = False
+    
+    # Insert all rows with one executemany, update movies already stored
+    statement = insert(Movies.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=natural_key_columns,
+        set_={column: statement.excluded[column] for column in update_columns})
+    with connections.get_sqlite_engine().begin() as connection:
+        connection.execute(statement, rows)
+    
+    return len(rows)
@@ -0,0 +1,133 @@
+import sys
+import os
+sys.path.append(os.environ.get('full_path'))
+from sqlalchemy import inspect, text
+from pymongo.operations import UpdateOne
+from crawler import db, normalization
+from DB import crud, connections
+from DB.schema import Base, Movies
+import logging
+
+# Parser per column that was stored as string before
+TYPED_FIELDS = {
+    'date_added': normalization.parse_date,
+    'release_year': normalization.parse_year,
+    'imdb_rating': normalization.parse_rating,
+    'num_ratings': normalization.parse_num_ratings,
+    'runtime': normalization.parse_runtime,
+}
+
+
+def normalize_movie(movie):
+    """Returns the typed values of all fields of a movie whose stored value differs from the typed value"""
+    changes = {}
+    for field, parse in TYPED_FIELDS.items():
+        if field not in movie:
+            continue
+        value = movie[field]
+        typed_value = parse(value)
+        # NaN is never equal to itself, so it is replaced by None as well
+        if typed_value != value or type(typed_value) is not type(value):
+            changes[field] = typed_value
+
+    return changes
+
+def migrate_movie_collection(collection, batch_size=500):
+    """Converts string ratings, number of ratings, runtime and dates of existing MongoDB documents to typed values
+
+    Returns:
+        int: Number of updated documents
+    """
+    projection = {field: 1 for field in TYPED_FIELDS}
+    request_list = []
+    number_updated = 0
+    for movie in collection.find({}, projection):
+        changes = normalize_movie(movie)
+        if changes:
+            request_list.append(UpdateOne({'_id': movie['_id']}, {'$set': changes}))
+        if len(request_list) >= batch_size:
+            number_updated += collection.bulk_write(request_list, ordered=False).modified_count
+            request_list = []
+    if request_list:
+        number_updated += collection.bulk_write(request_list, ordered=False).modified_count
+
+    return number_updated
+
+def migrate_top_movies_table(engine):
+    """Recreates the topMovies table with typed columns and converts the existing rows.
+    SQLite keeps the column affinity of a table, so the table has to be rebuilt.
+
+    Returns:
+        int: Number of migrated rows
+    """
+    with engine.begin() as connection:
+        if Movies.__tablename__ not in inspect(connection).get_table_names():
+            Base.metadata.create_all(connection)
+            return 0
+
+        rows = [dict(row) for row in connection.execute(text(f'SELECT * FROM {Movies.__tablename__}')).mappings()]
+        for row in rows:
+            row.update(normalize_movie(row))
+            if row['date_added'] is not None:
+                row['date_added'] = row['date_added'].date()
+
+        connection.execute(text(f'DROP TABLE {Movies.__tablename__}'))
+        Base.metadata.create_all(connection)
+        if rows:
+            connection.execute(Movies.__table__.insert(), rows)
+
+    return len(rows)
+
+def add_missing_columns(engine):
+    """Adds the columns of the schema that the topMovies table does not have yet, e.g. justwatch_link
+
+    Returns:
+        list: Names of the added columns
+    """
+    with engine.begin() as connection:
+        if Movies.__tablename__ not in inspect(connection).get_table_names():
+            return []
+        existing_columns = {column['name'] for column in inspect(connection).get_columns(Movies.__tablename__)}
+        added_columns = []
+        for column in Movies.__table__.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {Movies.__tablename__} ADD COLUMN {column.name} {column_type}'))
+                added_columns.append(column.name)
+
+    return added_columns
+
+def add_indexes(engine):
+    """Removes duplicate movies (keeping the first one stored) and adds the indexes of the schema,
+    including the unique index used for upserts
+
+    Returns:
+        int: Number of removed duplicates
+    """
+    key_columns = ', '.join(crud.natural_key_columns)
+    with engine.begin() as connection:
+        if Movies.__tablename__ not in inspect(connection).get_table_names():
+            return 0
+        number_removed = connection.execute(text(
+            f'DELETE FROM {Movies.__tablename__} WHERE id NOT IN '
+            f'(SELECT MIN(id) FROM {Movies.__tablename__} GROUP BY {key_columns})')).rowcount
+        for index in Movies.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+    return number_removed
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%H:%M:%S')
+
+    number_documents = migrate_movie_collection(db.connect_to_movie_collection())
+    logging.info(f'Migrated {number_documents} MongoDB documents.')
+
+    added_columns = add_missing_columns(connections.get_sqlite_engine())
+    logging.info(f'Added SQLite columns {added_columns}.')
+
+    number_removed = add_indexes(connections.get_sqlite_engine())
+    logging.info(f'Removed {number_removed} duplicate SQLite rows.')
+
+    number_rows = migrate_top_movies_table(connections.get_sqlite_engine())
+    logging.info(f'Migrated {number_rows} SQLite rows.')
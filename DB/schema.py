@@ -1,12 +1,6 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, Index
 from sqlalchemy.ext.declarative import declarative_base
 
-# Define the database file path
-database_file = 'top_movies.db'
-
-# Create the SQLAlchemy engine
-engine = create_engine(f'sqlite:///{database_file}', echo=True)
-
 # Create a base class for declarative models
 Base = declarative_base()
 
@@ -17,18 +11,29 @@ class Movies(Base):
 
     # Define the columns and their data types
     id = Column(Integer, primary_key=True)
-    date_added = Column(String)
+    date_added = Column(Date)
     name = Column(String)
     release_year = Column(Integer)
     imdb_link = Column(String)
-    imdb_rating = Column(String)
-    runtime = Column(String)
+    imdb_rating = Column(Float)
+    runtime = Column(Integer)
     flatrate_link = Column(String)
-    num_ratings = Column(String)
+    num_ratings = Column(Integer)
+    justwatch_link = Column(String)
     meta_provider = Column(String)
     meta_country = Column(String)
     sent = Column(Boolean)
 
+    # Natural key of a movie, used for upserts, and index for the oldest unsent movies of a provider
+    __table_args__ = (
+        Index('ix_topMovies_natural_key', 'imdb_link', 'meta_provider', 'meta_country', unique=True),
+        Index('ix_topMovies_unsent', 'meta_provider', 'sent', 'date_added'),
+    )
+
 if __name__ == '__main__':
     # Create the database and tables
-    Base.metadata.create_all(engine)
\ No newline at end of file
+    import sys
+    import os
+    sys.path.append(os.environ.get('full_path'))
+    from DB import connections
+    Base.metadata.create_all(connections.get_sqlite_engine())
\ No newline at end of file
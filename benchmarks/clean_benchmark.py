@@ -0,0 +1,140 @@
+"""Benchmark of clean_movie_data on synthetic scraped movies: row-wise cleaning vs. the vectorized cleaning.
+
+Usage:
+    python benchmarks/clean_benchmark.py [number_of_rows]
+"""
+import sys
+import os
+import copy
+import random
+import time
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'crawler'))
+import pandas as pd
+import normalization
+import webcrawling
+
+
+class InMemoryReferralCache:
+    """Referral cache that knows all links, so no link is resolved via network"""
+
+    def __init__(self, resolved_links):
+        self.resolved_links = resolved_links
+
+    def get_many(self, links):
+        return {link: self.resolved_links[link] for link in links if link in self.resolved_links}
+
+    def set_many(self, resolved_links):
+        self.resolved_links.update(resolved_links)
+
+def clean_movie_data_rowwise(movie_detail_dict, driver, country, provider, session=None, referral_cache=None):
+    """Previous implementation of clean_movie_data, concatenates one frame per date and cleans row by row"""
+    full_df = pd.concat([pd.DataFrame.from_dict(x) for x in movie_detail_dict.values()]).reset_index(drop=True)
+    full_df['name'] = full_df['name'].str.strip()
+    full_df['release_year'] = full_df['release_year'].str.extract(r'(\d{4})').apply(pd.to_numeric, errors='coerce')
+    full_df['imdb_link'] = full_df['imdb_link'].str.replace(r'\/\?ref_=justwatch','', regex=True)
+    full_df['num_ratings'] = full_df['imdb_rating'].str.extract(r'\((.*)\)')
+    full_df['imdb_rating'] = full_df['imdb_rating'].str.replace(r'\(.*\)', '', regex=True).apply(pd.to_numeric, errors='coerce')
+    full_df['flatrate_links'] = full_df['flatrate_links'].apply(lambda x: x if x else x.append(''))
+    full_df = full_df.loc[~(full_df['flatrate_links'].isna())]
+    all_links = [link for links in full_df['flatrate_links'] for link in links]
+    resolved_links = webcrawling.resolve_referrals(all_links, driver, session, referral_cache)
+    full_df['flatrate_links'] = full_df['flatrate_links'].apply(lambda x: [resolved_links[n] for n in x])
+    full_df ['flatrate_link'] = full_df['flatrate_links'].apply(lambda x: webcrawling.reduce_to_one_link(x, country, provider))
+    full_df['date_added'] = full_df['date_added'].map(normalization.parse_date)
+    full_df['release_year'] = full_df['release_year'].astype('Int64')
+    full_df['imdb_rating'] = full_df['imdb_rating'].map(normalization.parse_rating).astype('float')
+    full_df['num_ratings'] = full_df['num_ratings'].map(normalization.parse_num_ratings).astype('Int64')
+    full_df['runtime'] = full_df['runtime'].map(normalization.parse_runtime).astype('Int64')
+    full_df = full_df.astype(object).where(full_df.notna(), None)
+
+    return full_df
+
+def generate_movie_detail_dict(num_rows, seed=0):
+    """Scraped movie details over 7 dates, every movie with one to three flatrate links, one of them of Netflix
+
+    Returns:
+        tuple: Movie detail dict and dict with the resolved link of every referral link
+    """
+    rng = random.Random(seed)
+    dates = webcrawling.get_dates(6)
+    movie_detail_dict = {date: [] for date in dates}
+    resolved_links = {}
+    for i in range(num_rows):
+        flatrate_links = []
+        for j in range(rng.randint(1, 3)):
+            referral_link = f'https://click.justwatch.com/a?cx={i}-{j}'
+            resolved_links[referral_link] = f'https://www.{"netflix" if j == 0 else "amazon"}.com/title/{i}{j}'
+            flatrate_links.append(referral_link)
+        rng.shuffle(flatrate_links)
+        movie_detail_dict[dates[i % len(dates)]].append({
+            'date_added': dates[i % len(dates)],
+            'name': f'  Movie {i} ',
+            'release_year': rng.choice([f'({rng.randint(1950, 2023)})', '']),
+            'imdb_link': f'https://www.imdb.com/title/tt{i:07d}/?ref_=justwatch',
+            'imdb_rating': rng.choice([f'{rng.randint(10, 99) / 10} ({rng.randint(1, 999)}k)', f'{rng.randint(10, 99) / 10} ({rng.randint(1, 9)}.{rng.randint(0, 9)}m)', '']),
+            'runtime': rng.choice([f'{rng.randint(1, 3)}h {rng.randint(0, 59)}min', f'{rng.randint(20, 59)}min', '']),
+            'flatrate_links': flatrate_links,
+            'justwatch_link': f'https://www.justwatch.com/de/Film/movie-{i}',
+        })
+
+    return movie_detail_dict, resolved_links
+
+def check_movies_without_links(num_rows=100):
+    """Movies without flatrate links get the default link of the provider, also if no movie of the batch has a
+    link. The previous implementation dropped them, the movies with links have to be cleaned the same way.
+    """
+    movie_detail_dict, resolved_links = generate_movie_detail_dict(num_rows)
+    for i, movies in enumerate(movie_detail_dict.values()):
+        for movie in movies[i % 2::2]:
+            movie['flatrate_links'] = []
+    default_link = webcrawling.mappings.default_link_dict['Germany']['Netflix']
+
+    # Only some movies without links, the previous implementation appends to the lists, so it gets a copy
+    old_df = clean_movie_data_rowwise(copy.deepcopy(movie_detail_dict), None, 'Germany', 'Netflix',
+                                      referral_cache=InMemoryReferralCache(resolved_links))
+    new_df = webcrawling.clean_movie_data(movie_detail_dict, None, 'Germany', 'Netflix',
+                                          referral_cache=InMemoryReferralCache(resolved_links))
+    has_links = new_df['flatrate_links'].map(len) > 0
+    pd.testing.assert_frame_equal(old_df.reset_index(drop=True), new_df[has_links].reset_index(drop=True))
+    assert (new_df.loc[~has_links, 'flatrate_link'] == default_link).all()
+
+    # No movie with links
+    for movies in movie_detail_dict.values():
+        for movie in movies:
+            movie['flatrate_links'] = []
+    new_df = webcrawling.clean_movie_data(movie_detail_dict, None, 'Germany', 'Netflix',
+                                          referral_cache=InMemoryReferralCache({}))
+    assert len(new_df) == num_rows and (new_df['flatrate_link'] == default_link).all()
+
+    return
+
+def run_benchmark(num_rows=10000, repeats=3):
+    movie_detail_dict, resolved_links = generate_movie_detail_dict(num_rows)
+
+    # Previous implementation
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        old_df = clean_movie_data_rowwise(movie_detail_dict, None, 'Germany', 'Netflix',
+                                          referral_cache=InMemoryReferralCache(resolved_links))
+    old_time = (time.perf_counter() - start_time) / repeats
+
+    # Vectorized implementation
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        new_df = webcrawling.clean_movie_data(movie_detail_dict, None, 'Germany', 'Netflix',
+                                              referral_cache=InMemoryReferralCache(resolved_links))
+    new_time = (time.perf_counter() - start_time) / repeats
+
+    pd.testing.assert_frame_equal(old_df, new_df)
+    check_movies_without_links()
+
+    print(f'{num_rows} rows')
+    print(f'Row-wise:   {old_time * 1000:.0f} ms')
+    print(f'Vectorized: {new_time * 1000:.0f} ms')
+    print(f'Speed-up:   {old_time / new_time:.1f}x')
+
+    return old_time, new_time
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,64 @@
+"""Microbenchmark of filling the newsletter template with movies: BeautifulSoup tree editing vs. the compiled template.
+
+Usage:
+    python benchmarks/newsletter_benchmark.py [path/to/newsletter_template.html]
+"""
+import sys
+import os
+import time
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bs4 import BeautifulSoup
+from mailing import templating
+from mailing.create_mails import insert_mail_content
+
+DEFAULT_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates',
+                                     'newsletter_template.html')
+
+
+def get_sample_movies():
+    """Three movies per provider, one of them added from the provider's library"""
+    movie_dict = {}
+    for provider in templating.PROVIDERS:
+        movie_dict[provider] = [{
+            'name': f'{provider} movie {i} – Amélie & friends',
+            'imdb_rating': 8.1 - i / 10,
+            'release_year': 2020 + i,
+            'runtime': 95 + i * 10,
+            'flatrate_link': f'https://www.example.com/watch?id={i}&provider={provider}',
+        } for i in range(3)]
+        movie_dict[provider][-1]['top_movie'] = True
+
+    return movie_dict
+
+def run_benchmark(template, repeats=50):
+    movie_dict = get_sample_movies()
+
+    # Previous implementation, parses, edits and prettifies the whole template on every call
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        soup = BeautifulSoup(template, features="html.parser")
+        old_html = insert_mail_content(soup, movie_dict).prettify(formatter='html')
+    old_time = (time.perf_counter() - start_time) / repeats
+
+    # Compiled template, parsed once and then only rendered
+    start_time = time.perf_counter()
+    compiled_template = templating.CompiledNewsletterTemplate(template)
+    compile_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        new_html = compiled_template.render(movie_dict)
+    new_time = (time.perf_counter() - start_time) / repeats
+
+    assert old_html == new_html, 'Compiled template renders different markup'
+
+    print(f'BeautifulSoup:     {old_time * 1000:.2f} ms per render')
+    print(f'Compile template:  {compile_time * 1000:.2f} ms once')
+    print(f'Compiled template: {new_time * 1000:.3f} ms per render')
+    print(f'Speed-up:          {old_time / new_time:.0f}x')
+
+    return old_time, new_time
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TEMPLATE_PATH, 'r') as f:
+        run_benchmark(f.read())
@@ -0,0 +1,47 @@
+"""Microbenchmark of the detail page parsers on the detail pages of a replay corpus.
+
+Usage:
+    python benchmarks/parser_benchmark.py path/to/corpus [--repeats 5]
+"""
+import sys
+import os
+import argparse
+import time
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'crawler'))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+import parsers
+from replay import ReplayCorpus
+
+
+def run_benchmark(corpus_dir, repeats=5):
+    corpus = ReplayCorpus(corpus_dir)
+    pages = corpus.load()
+    detail_pages = [pages[url]['html'] for url in corpus.manifest['pages']]
+    if not detail_pages:
+        raise ValueError('No detail pages found in corpus')
+
+    parse_times = {}
+    parse_results = {}
+    for name, parse in parsers.DETAIL_PARSERS.items():
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            parse_results[name] = [parse(html) for html in detail_pages]
+        parse_times[name] = (time.perf_counter() - start_time) / repeats / len(detail_pages)
+
+    for name, results in parse_results.items():
+        assert results == parse_results['bs4'], f'{name} extracts different details than bs4'
+
+    print(f'{len(detail_pages)} detail pages, {sum(map(len, detail_pages)) / len(detail_pages) / 1024:.0f} KB average')
+    for name, parse_time in parse_times.items():
+        print(f'{name:<6}{parse_time * 1000:>8.2f} ms per page, {parse_times["bs4"] / parse_time:.1f}x')
+
+    return parse_times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus_dir')
+    parser.add_argument('--repeats', type=int, default=5)
+    arguments = parser.parse_args()
+
+    run_benchmark(arguments.corpus_dir, arguments.repeats)
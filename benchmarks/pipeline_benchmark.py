@@ -0,0 +1,235 @@
+"""Benchmark of the scraping and parsing pipeline on a replayed corpus, runs without network.
+
+Reports latency, pages (or links) per second and the peak RSS of each stage: get_timeline_links,
+extract_movie_details_from_link via the driver and via http, clean_movie_data and reduce_to_one_link.
+The RSS is sampled from /proc while the stage runs, so it is only reported on Linux.
+
+With --baseline the results are compared to an earlier run, e.g. in CI. The exit code is 1 if the
+throughput of a stage dropped or its memory growth rose by more than the tolerance.
+
+Usage:
+    python benchmarks/replay.py synthetic /tmp/corpus
+    python benchmarks/pipeline_benchmark.py /tmp/corpus [--latency-ms 0] [--json results.json]
+    python benchmarks/pipeline_benchmark.py /tmp/corpus --baseline results.json [--tolerance 0.2]
+"""
+import sys
+import os
+import argparse
+import json
+import threading
+import time
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'crawler'))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+import webcrawling
+from replay import ReplayCorpus, ReplayDriver, set_up_replay_session
+
+
+# Memory growth below this many MB is not counted as regression, it is within the noise of the allocator.
+# The throughput of stages faster than this many seconds is too noisy to be compared.
+RSS_GROWTH_SLACK_MB = 5
+MIN_COMPARED_SECONDS = 0.01
+
+
+def get_current_rss_mb():
+    """Current resident memory of the process, None if /proc is not available (e.g. on macOS)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return None
+
+class RSSSampler:
+    """Samples the current RSS in a background thread and keeps the peak, i.e. the peak of one stage
+    and not of the whole process like ru_maxrss
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start_rss_mb = None
+        self.peak_rss_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while True:
+            rss_mb = get_current_rss_mb()
+            if rss_mb is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, rss_mb)
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self.start_rss_mb = get_current_rss_mb()
+        self.peak_rss_mb = self.start_rss_mb
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        # Also sample once more, a short stage can end before the first sample
+        rss_mb = get_current_rss_mb()
+        if rss_mb is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0, rss_mb)
+
+class StageTimer:
+    """Collects the duration, number of processed items and peak RSS of each stage"""
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, function, count_items):
+        """Runs a stage once
+
+        Args:
+            name (str): Name of the stage
+            function (callable): Stage without arguments
+            count_items (callable): Returns the number of pages or links processed, given the stage result
+
+        Returns:
+            Result of the stage
+        """
+        with RSSSampler() as rss_sampler:
+            start_time = time.perf_counter()
+            result = function()
+            elapsed_time = time.perf_counter() - start_time
+
+        num_items = count_items(result)
+        self.results[name] = {
+            'seconds': elapsed_time,
+            'items': num_items,
+            'items_per_second': num_items / elapsed_time if elapsed_time else float('inf'),
+            'peak_rss_mb': rss_sampler.peak_rss_mb,
+            'rss_growth_mb': (rss_sampler.peak_rss_mb - rss_sampler.start_rss_mb
+                              if rss_sampler.start_rss_mb is not None else None),
+        }
+
+        return result
+
+    def print_summary(self):
+        print(f"{'stage':<22}{'seconds':>10}{'items':>8}{'items/s':>12}{'peak RSS MB':>14}{'growth MB':>12}")
+        for name, stage in self.results.items():
+            peak_rss = f"{stage['peak_rss_mb']:.1f}" if stage['peak_rss_mb'] is not None else 'n/a'
+            rss_growth = f"{stage['rss_growth_mb']:.1f}" if stage['rss_growth_mb'] is not None else 'n/a'
+            print(f"{name:<22}{stage['seconds']:>10.3f}{stage['items']:>8}{stage['items_per_second']:>12.1f}"
+                  f"{peak_rss:>14}{rss_growth:>12}")
+
+        return
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """Compares the results to the results of an earlier run
+
+    Args:
+        results (dict): Results of this run, see run_benchmark
+        baseline (dict): Results of the earlier run
+        tolerance (float): Allowed relative drop of the throughput and rise of the memory growth
+
+    Returns:
+        list: Descriptions of the regressed stages, empty if there is no regression
+    """
+    regressions = []
+    for name, baseline_stage in baseline.items():
+        stage = results.get(name)
+        if stage is None:
+            continue
+
+        if (baseline_stage['seconds'] >= MIN_COMPARED_SECONDS
+                and stage['items_per_second'] < baseline_stage['items_per_second'] * (1 - tolerance)):
+            regressions.append(f"{name}: {stage['items_per_second']:.1f} items/s, "
+                               f"baseline {baseline_stage['items_per_second']:.1f} items/s")
+
+        if stage.get('rss_growth_mb') is not None and baseline_stage.get('rss_growth_mb') is not None:
+            allowed_growth = baseline_stage['rss_growth_mb'] * (1 + tolerance) + RSS_GROWTH_SLACK_MB
+            if stage['rss_growth_mb'] > allowed_growth:
+                regressions.append(f"{name}: RSS grew by {stage['rss_growth_mb']:.1f} MB, "
+                                   f"baseline {baseline_stage['rss_growth_mb']:.1f} MB")
+
+    return regressions
+
+def count_links(movie_link_dicts):
+    return sum(len(links) for movie_link_dict in movie_link_dicts for links in movie_link_dict.values())
+
+def run_benchmark(corpus_dir, latency=0.0):
+    """Runs all stages on every timeline of the corpus
+
+    Args:
+        corpus_dir (str): Directory of the corpus
+        latency (float): Seconds every simulated page load or request takes
+
+    Returns:
+        dict: Dictionary with the stage as key and seconds, items, items per second and peak RSS as values
+    """
+    corpus = ReplayCorpus(corpus_dir)
+    pages = corpus.load()
+    driver = ReplayDriver(corpus, pages, latency)
+    session = set_up_replay_session(corpus, pages, latency)
+    timelines = corpus.manifest['timelines']
+    timer = StageTimer()
+
+    # Timeline links, pages are loaded and scrolled like on justwatch.com
+    def get_all_timeline_links():
+        movie_link_dicts = []
+        for timeline in timelines:
+            driver.get(timeline['url'])
+            movie_link_dicts.append(webcrawling.get_timeline_links(driver, days_backwards=1))
+        return movie_link_dicts
+    movie_link_dicts = timer.run('timeline_links', get_all_timeline_links, lambda _: len(timelines))
+
+    # Only links of the corpus are replayed
+    movie_link_dicts = [{date: [link for link in links if link in corpus.manifest['pages']]
+                         for date, links in movie_link_dict.items()} for movie_link_dict in movie_link_dicts]
+
+    # Detail pages rendered by the driver and fetched via http
+    timer.run('details_driver', lambda: [webcrawling.extract_movie_details(movie_link_dict, driver)
+                                         for movie_link_dict in movie_link_dicts],
+              lambda _: count_links(movie_link_dicts))
+    movie_detail_dicts = timer.run('details_http',
+                                   lambda: [webcrawling.extract_movie_details(movie_link_dict, driver, session)
+                                            for movie_link_dict in movie_link_dicts],
+                                   lambda _: count_links(movie_link_dicts))
+
+    # Cleaning, including the resolution of referral links
+    clean_movie_dfs = timer.run('clean_movie_data',
+                                lambda: [webcrawling.clean_movie_data(movie_detail_dict, driver, timeline['country'],
+                                                                      timeline['provider'], session=session)
+                                         for movie_detail_dict, timeline in zip(movie_detail_dicts, timelines)
+                                         if movie_detail_dict],
+                                lambda dfs: sum(len(df) for df in dfs))
+
+    # Link reduction on its own, with the resolved links of all movies
+    link_lists = [(links, timeline['country'], timeline['provider'])
+                  for clean_movie_df, timeline in zip(clean_movie_dfs, timelines)
+                  for links in clean_movie_df['flatrate_links']]
+    timer.run('reduce_to_one_link', lambda: [webcrawling.reduce_to_one_link(*link_list) for link_list in link_lists],
+              len)
+
+    session.close()
+    timer.print_summary()
+
+    return timer.results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus_dir')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Simulated latency per page load and request')
+    parser.add_argument('--json', help='Write the results to this file, e.g. to use them as baseline')
+    parser.add_argument('--baseline', help='Results of an earlier run, exit with code 1 if a stage regressed')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression per stage')
+    arguments = parser.parse_args()
+
+    results = run_benchmark(arguments.corpus_dir, arguments.latency_ms / 1000)
+    if arguments.json:
+        with open(arguments.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if arguments.baseline:
+        with open(arguments.baseline, 'r') as f:
+            regressions = compare_to_baseline(results, json.load(f), arguments.tolerance)
+        for regression in regressions:
+            print(f'Regression in {regression}')
+        sys.exit(1 if regressions else 0)
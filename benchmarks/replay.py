@@ -0,0 +1,362 @@
+"""Offline replay of JustWatch pages for benchmarking the scraping and parsing pipeline without network.
+
+A corpus is a directory with a manifest.json and one html file per recorded page. It holds provider timeline
+pages, rendered and server-side html of detail pages and the redirect chains of referral links. ReplayDriver
+serves the corpus in place of the chromedriver and ReplayAdapter serves it to a requests session.
+
+Usage:
+    python benchmarks/replay.py record path/to/corpus --countries Germany --providers Netflix "Amazon Prime Video"
+    python benchmarks/replay.py synthetic path/to/corpus --timelines 4 --movies 50
+"""
+import sys
+import os
+import argparse
+import datetime
+import hashlib
+import io
+import json
+import logging
+import random
+import re
+import time
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'crawler'))
+from bs4 import BeautifulSoup
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from selenium.webdriver.remote.webelement import WebElement
+import webcrawling
+
+# Number of timeline items loaded per scroll by the replay driver
+ITEMS_PER_SCROLL = 8
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+class ReplayCorpus:
+    """Recorded pages and redirect chains, stored as html files and a manifest"""
+
+    def __init__(self, corpus_dir):
+        self.corpus_dir = corpus_dir
+        self.manifest_path = os.path.join(corpus_dir, 'manifest.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'recorded_on': datetime.date.today().isoformat(), 'timelines': [], 'pages': {},
+                             'redirects': {}}
+
+    def _write_html(self, url, html, suffix):
+        file_name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + suffix + '.html'
+        with open(os.path.join(self.corpus_dir, file_name), 'w', encoding='utf-8') as f:
+            f.write(html)
+        return file_name
+
+    def add_timeline(self, url, html, country, provider):
+        self.manifest['timelines'].append({'url': url, 'file': self._write_html(url, html, ''),
+                                           'country': country, 'provider': provider})
+
+    def add_detail_page(self, url, rendered_html, http_html=None, date=None):
+        """Adds a detail page as rendered by the browser and optionally as served via http"""
+        self.manifest['pages'][url] = {
+            'file': self._write_html(url, rendered_html, ''),
+            'http_file': self._write_html(url, http_html, '-http') if http_html is not None else None,
+            'date': date,
+        }
+
+    def add_redirect(self, chain, http=True):
+        """Adds the redirect chain of a referral link, from the referral link to the final url
+
+        Args:
+            chain (list): Urls of all hops
+            http (bool): Whether the link redirects via http or only in the browser
+        """
+        self.manifest['redirects'][chain[0]] = {'chain': chain, 'http': http}
+
+    def save(self):
+        os.makedirs(self.corpus_dir, exist_ok=True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+
+    def read_html(self, file_name):
+        with open(os.path.join(self.corpus_dir, file_name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def get_date_offset(self):
+        """Days between recording and today, timeline dates are shifted by this offset on replay"""
+        return (datetime.date.today() - datetime.date.fromisoformat(self.manifest['recorded_on'])).days
+
+    def load(self):
+        """Reads all recorded html into memory so the replay does not measure disk reads
+
+        Returns:
+            dict: Dictionary with the url as key and a dict with the rendered and http html as value
+        """
+        date_offset = datetime.timedelta(days=self.get_date_offset())
+        shift_dates = lambda html: DATE_PATTERN.sub(
+            lambda match: (datetime.date.fromisoformat(match.group()) + date_offset).isoformat(), html)
+
+        pages = {}
+        for timeline in self.manifest['timelines']:
+            pages[timeline['url']] = {'html': shift_dates(self.read_html(timeline['file'])), 'http_html': None}
+        for url, page in self.manifest['pages'].items():
+            pages[url] = {'html': self.read_html(page['file']),
+                          'http_html': self.read_html(page['http_file']) if page['http_file'] else None}
+
+        return pages
+
+class ReplayDriver:
+    """Stand-in for the chromedriver that serves pages from a corpus.
+    Timelines load ITEMS_PER_SCROLL more items on every scroll, referral links end on their final url.
+    """
+
+    def __init__(self, corpus, pages=None, latency=0.0):
+        """
+        Args:
+            corpus (ReplayCorpus): Recorded corpus
+            pages (dict, optional): Pages as returned by corpus.load, loaded if None
+            latency (float): Seconds every page load takes, to simulate the network
+        """
+        self.corpus = corpus
+        self.pages = pages if pages is not None else corpus.load()
+        self.latency = latency
+        self.current_url = None
+        self.page_source = ''
+        self.pages_loaded = 0
+        self._timelines = []
+        self._num_items_shown = 0
+
+    def get(self, url):
+        if self.latency:
+            time.sleep(self.latency)
+        self.pages_loaded += 1
+
+        redirect = self.corpus.manifest['redirects'].get(url)
+        if redirect is not None:
+            self.current_url, self.page_source = redirect['chain'][-1], ''
+            return
+
+        page = self.pages.get(url)
+        if page is None:
+            logging.debug(f'Url {url} not in corpus')
+        self.current_url = url
+        self.page_source = page['html'] if page is not None else ''
+
+        # Keep the links of all timeline items, only the first ones are loaded before scrolling
+        soup = BeautifulSoup(self.page_source, features='html.parser')
+        self._timelines = []
+        for time_line in soup.find_all('div', class_='provider-timeline'):
+            links = [item.find('a', recursive=False) for item in time_line.find_all('div', class_='horizontal-title-list__item')]
+            self._timelines.append([link.get('href') if link is not None else None for link in links])
+        self._num_items_shown = ITEMS_PER_SCROLL
+
+    def execute_script(self, script, *args):
+        if script == webcrawling.TIMELINE_ITEMS_SCRIPT:
+            hrefs = self._timelines[args[0]][:self._num_items_shown]
+            last_item = WebElement(self, f'timeline-{args[0]}-item-{len(hrefs) - 1}') if hrefs else None
+            return {'hrefs': hrefs, 'last_item': last_item}
+        if 'querySelectorAll(arguments[0]).length' in script:
+            return len(BeautifulSoup(self.page_source, features='html.parser').select(args[0]))
+        return None
+
+    def execute(self, command, params=None):
+        # Only scroll actions are sent by the pipeline, every scroll loads more timeline items
+        self._num_items_shown += ITEMS_PER_SCROLL
+        return {'value': None}
+
+    def find_element(self, by, value):
+        return WebElement(self, value)
+
+    def quit(self):
+        return
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter that answers requests from a corpus, including the redirects of referral links"""
+
+    def __init__(self, corpus, pages=None, latency=0.0):
+        super().__init__()
+        self.pages = pages if pages is not None else corpus.load()
+        self.latency = latency
+        self.requests_sent = 0
+
+        # Next hop of every url in a redirect chain, links that only redirect in the browser stay unresolved
+        self.next_hops = {}
+        for redirect in corpus.manifest['redirects'].values():
+            if redirect['http']:
+                chain = redirect['chain']
+                self.next_hops.update(zip(chain[:-1], chain[1:]))
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        self.requests_sent += 1
+
+        response = Response()
+        response.request = request
+        response.url = request.url
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        response.encoding = 'utf-8'
+
+        page = self.pages.get(request.url)
+        if request.url in self.next_hops:
+            response.status_code, response.reason = 302, 'Found'
+            response.headers['Location'] = self.next_hops[request.url]
+            content = b''
+        elif page is not None:
+            response.status_code, response.reason = 200, 'OK'
+            content = b'' if request.method == 'HEAD' else (page['http_html'] or page['html']).encode('utf-8')
+        else:
+            response.status_code, response.reason = 404, 'Not Found'
+            content = b''
+
+        response._content = content
+        response._content_consumed = True
+        response.raw = io.BytesIO(content)
+        return response
+
+    def close(self):
+        return
+
+def set_up_replay_session(corpus, pages=None, latency=0.0):
+    """Sets up a http session like webcrawling.set_up_http_session that is served from the corpus"""
+    session = webcrawling.set_up_http_session()
+    adapter = ReplayAdapter(corpus, pages, latency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+def record_corpus(corpus_dir, countries, providers, days_backwards=1, max_detail_pages=30):
+    """Records timeline pages, detail pages and referral redirects from justwatch.com with the chromedriver
+
+    Args:
+        corpus_dir (str): Directory the corpus is written to
+        countries (list): Countries to record
+        providers (list): Providers to record
+        days_backwards (int): Number of days in the past of the timelines
+        max_detail_pages (int): Maximum number of detail pages recorded per provider
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    corpus = ReplayCorpus(corpus_dir)
+    driver = webcrawling.set_up_chromedriver()
+    session = webcrawling.set_up_http_session()
+
+    try:
+        for country in countries:
+            for provider in providers:
+                url = webcrawling.mappings.country_provider_dict[country][provider]
+                driver.get(url)
+                webcrawling.handle_consent_popup(driver)
+
+                # Record the timeline after scrolling, so it contains all items
+                movie_link_dict = webcrawling.get_timeline_links(driver, days_backwards=days_backwards)
+                corpus.add_timeline(url, driver.page_source, country, provider)
+
+                jobs = [(date, link) for date, links in movie_link_dict.items() for link in links][:max_detail_pages]
+                for date, link in jobs:
+                    driver.get(link)
+                    rendered_html = driver.page_source
+                    try:
+                        http_html = session.get(link, timeout=webcrawling.HTTP_TIMEOUT).text
+                    except Exception:
+                        http_html = None
+                    corpus.add_detail_page(link, rendered_html, http_html, date)
+
+                    # Record where the referral links lead, via http if possible, else in the browser
+                    for referral_link in webcrawling.parse_movie_details(rendered_html, date)['flatrate_links']:
+                        try:
+                            response = session.get(referral_link, timeout=webcrawling.HTTP_TIMEOUT, stream=True)
+                            response.close()
+                            chain = [hop.url for hop in response.history] + [response.url]
+                        except Exception:
+                            chain = [referral_link]
+                        if len(chain) > 1:
+                            corpus.add_redirect(chain, http=True)
+                        else:
+                            corpus.add_redirect([referral_link, webcrawling.remove_referral(referral_link, driver)],
+                                               http=False)
+                logging.info(f'Recorded {len(jobs)} detail pages of {provider} in {country}')
+                corpus.save()
+    finally:
+        driver.quit()
+        session.close()
+
+    return corpus
+
+def generate_synthetic_corpus(corpus_dir, num_timelines=4, num_movies=50, seed=0):
+    """Generates a corpus with the markup the parsers expect, for machines without network or recorded corpus
+
+    Args:
+        corpus_dir (str): Directory the corpus is written to
+        num_timelines (int): Number of provider timeline pages (Germany, all providers of the mappings in turn)
+        num_movies (int): Number of movies per timeline, spread over today and yesterday
+        seed (int): Seed of the random movie details
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    corpus = ReplayCorpus(corpus_dir)
+    rng = random.Random(seed)
+    dates = webcrawling.get_dates(1)
+    providers = list(webcrawling.mappings.country_provider_dict['Germany'])
+
+    for t in range(num_timelines):
+        provider = providers[t % len(providers)]
+        provider_slug = webcrawling.mappings.provider_slugs[provider]
+        url = webcrawling.mappings.country_provider_dict['Germany'][provider] + (f'?page={t}' if t >= len(providers) else '')
+
+        timelines_html = ''
+        for d, date in enumerate(dates):
+            links = [f'/de/Film/synthetic-{t}-{d}-{m}' for m in range(num_movies // len(dates))]
+            items_html = ''.join(f'<div class="horizontal-title-list__item"><a href="{link}"><img alt="poster"/></a></div>'
+                                 for link in links)
+            timelines_html += (f'<div class="timeline__timeframe timeline__timeframe--{date}">'
+                               f'<div class="provider-timeline"><div class="timeline__header">{len(links)} Filme</div>'
+                               f'<div class="hidden-horizontal-scrollbar__items">{items_html}</div></div></div>')
+
+            for link in links:
+                detail_url = 'https://www.justwatch.com' + link
+                referral_link = f'https://click.justwatch.com/a?cx={rng.getrandbits(64)}&r={provider_slug}'
+                final_link = f'https://www.{provider_slug}.com/title/{rng.randint(10000, 99999)}'
+                hours, minutes = divmod(rng.randint(80, 180), 60)
+                detail_html = (
+                    f'<html><body><div class="title-block"><h1> Synthetic movie {link[-8:]} </h1>'
+                    f'<span>({rng.randint(1970, 2023)})</span></div>'
+                    f'<div v-uib-tooltip="IMDB"><a href="https://www.imdb.com/title/tt{rng.randint(1000000, 9999999)}'
+                    f'/?ref_=justwatch">{rng.randint(30, 90) / 10} ({rng.randint(1, 900)}k)</a></div>'
+                    f'<div>Laufzeit</div><div>{hours}h {minutes}min</div>'
+                    f'<div class="price-comparison--block"><div class="presentation-type '
+                    f'price-comparison__grid__row__element__icon"><a href="{referral_link}">Flatrate</a></div></div>'
+                    f'</body></html>')
+                corpus.add_detail_page(detail_url, detail_html, detail_html, date)
+
+                # Most providers redirect via http, some only via javascript in the browser
+                http_redirect = rng.random() < 0.8
+                chain = [referral_link, f'https://www.{provider_slug}.com/redirect?to={final_link}', final_link]
+                corpus.add_redirect(chain if http_redirect else [referral_link, final_link], http=http_redirect)
+
+        corpus.add_timeline(url, f'<html><body>{timelines_html}</body></html>', 'Germany', provider)
+
+    corpus.save()
+
+    return corpus
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%H:%M:%S')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='Record a corpus from justwatch.com')
+    record_parser.add_argument('corpus_dir')
+    record_parser.add_argument('--countries', nargs='+', default=['Germany'])
+    record_parser.add_argument('--providers', nargs='+', default=['Netflix', 'Amazon Prime Video'])
+    record_parser.add_argument('--days-backwards', type=int, default=1)
+    record_parser.add_argument('--max-detail-pages', type=int, default=30)
+    synthetic_parser = subparsers.add_parser('synthetic', help='Generate a synthetic corpus')
+    synthetic_parser.add_argument('corpus_dir')
+    synthetic_parser.add_argument('--timelines', type=int, default=4)
+    synthetic_parser.add_argument('--movies', type=int, default=50)
+    arguments = parser.parse_args()
+
+    if arguments.command == 'record':
+        record_corpus(arguments.corpus_dir, arguments.countries, arguments.providers, arguments.days_backwards,
+                      arguments.max_detail_pages)
+    else:
+        generate_synthetic_corpus(arguments.corpus_dir, arguments.timelines, arguments.movies)
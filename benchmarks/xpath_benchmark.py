@@ -0,0 +1,67 @@
+"""Microbenchmark of the xpath generation for timeline scrollbars and items on a saved JustWatch page.
+
+Usage:
+    python benchmarks/xpath_benchmark.py path/to/saved_provider_page.html
+"""
+import sys
+import os
+import time
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'crawler'))
+from bs4 import BeautifulSoup
+from locators import XPathCache
+
+
+def xpath_soup(element):
+    """Previous xpath generation, walks all siblings on every ancestor level"""
+    components = []
+    child = element if element.name else element.parent
+    for parent in child.parents:
+        siblings = parent.find_all(child.name, recursive=False)
+        components.append(
+            child.name if 1 == len(siblings) else '%s[%d]' % (
+                child.name,
+                next(i for i, s in enumerate(siblings, 1) if s is child)
+                )
+            )
+        child = parent
+    components.reverse()
+    return '/%s' % '/'.join(components)
+
+def get_scroll_targets(soup):
+    """Returns the elements used as scroll targets: timeline scrollbars and timeline items"""
+    targets = soup.findAll('div', class_='hidden-horizontal-scrollbar__items')
+    targets += soup.findAll('div', class_='horizontal-title-list__item')
+    return targets
+
+def run_benchmark(html, repeats=20):
+    soup = BeautifulSoup(html, features="html.parser")
+    targets = get_scroll_targets(soup)
+    if not targets:
+        raise ValueError('No timeline scrollbars or items found in page')
+
+    # Previous implementation, every call walks the DOM from scratch
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        old_xpaths = [xpath_soup(target) for target in targets]
+    old_time = (time.perf_counter() - start_time) / repeats
+
+    # Cached implementation, one cache per parsed page as in get_timeline_links
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        xpath_cache = XPathCache(soup)
+        new_xpaths = [xpath_cache.xpath(target) for target in targets]
+    new_time = (time.perf_counter() - start_time) / repeats
+
+    assert old_xpaths == new_xpaths, 'Cached xpaths differ from previous implementation'
+
+    print(f'{len(targets)} scroll targets')
+    print(f'xpath_soup:  {old_time * 1000:.2f} ms per page')
+    print(f'XPathCache:  {new_time * 1000:.2f} ms per page')
+    print(f'Speed-up:    {old_time / new_time:.1f}x')
+
+    return old_time, new_time
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1], 'r') as f:
+        run_benchmark(f.read())
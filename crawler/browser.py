@@ -0,0 +1,327 @@
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import WebDriverException
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+import json
+import logging
+import os
+import tempfile
+import time
+
+# Drivers are restarted after this many pages or once the browser uses more memory than this
+DEFAULT_MAX_PAGES = 200
+DEFAULT_MAX_RSS_MB = 1500
+RSS_CHECK_INTERVAL = 10
+
+# Images are blocked via the content settings of the profile, fonts and media via the DevTools protocol
+BLOCKED_CONTENT_SETTINGS = {'profile.managed_default_content_settings.images': 2}
+BLOCKED_URL_PATTERNS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+                        '*.mp4', '*.webm', '*.m3u8', '*.mp3', '*.ogg']
+
+# The consent pop-up stores its state in cookies and the local storage of justwatch.com
+CONSENT_DOMAIN = 'justwatch.com'
+CONSENT_STORAGE_SCRIPT = """
+if (location.hostname.endsWith(%s)) {
+    try {
+        for (const [key, value] of Object.entries(%s)) {
+            if (localStorage.getItem(key) === null) localStorage.setItem(key, value);
+        }
+    } catch (e) {}
+}
+"""
+
+
+def get_default_consent_path():
+    return os.environ.get('full_path') + '/crawler/consent_state.json'
+
+def get_default_chromedriver_path():
+    return os.environ.get('full_path') + '/crawler/chromedriver'
+
+def create_chromedriver(chromedriver_path=None):
+    """Starts a headless chromedriver that loads pages eagerly and does not load images, fonts and media
+
+    Args:
+        chromedriver_path (str, optional): Path of the chromedriver binary, None to use the default path
+
+    Returns:
+        webdriver.Chrome: chromedriver instance
+    """
+    options = Options()
+    options.add_argument('--headless')
+    # Return from get() once the DOM is parsed, the crawler waits for the elements it needs itself
+    options.page_load_strategy = 'eager'
+    options.add_experimental_option('prefs', BLOCKED_CONTENT_SETTINGS)
+
+    driver = webdriver.Chrome(service=Service(chromedriver_path or get_default_chromedriver_path()), options=options)
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    except WebDriverException as e:
+        logging.debug(f'Could not block fonts and media: {e}')
+
+    return driver
+
+def get_process_tree_rss_mb(pid):
+    """Resident memory of a process and all of its descendants, e.g. chromedriver and its browser processes.
+    Shared pages are counted once per process, so the value is an upper bound.
+
+    Returns:
+        float: Resident memory in MB, None if it cannot be read (e.g. not on Linux)
+    """
+    try:
+        # Map every process to its children
+        children = defaultdict(list)
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    parent_pid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children[parent_pid].append(int(entry))
+
+        # Sum the resident pages of the process tree
+        num_pages = 0
+        pids = [pid]
+        while pids:
+            current_pid = pids.pop()
+            try:
+                with open(f'/proc/{current_pid}/statm') as f:
+                    num_pages += int(f.read().split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+            pids += children[current_pid]
+    except OSError:
+        return None
+
+    return num_pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+def load_consent_state(path):
+    """Loads the stored consent state, None if there is none or it cannot be read"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logging.debug(f'Could not read consent state {path}')
+        return None
+
+def restore_consent_state(driver, consent_state):
+    """Sets the stored consent cookies and local storage in a new driver, before any page is opened
+
+    Returns:
+        bool: True if a consent state was restored
+    """
+    now = time.time()
+    cookies = [cookie for cookie in consent_state.get('cookies', []) if cookie.get('expiry', now + 1) > now]
+    if not cookies and not consent_state.get('local_storage'):
+        return False
+
+    try:
+        # Cookies are set via the DevTools protocol, selenium can only add cookies for the open page
+        for cookie in cookies:
+            cdp_cookie = {key: cookie[key] for key in ['name', 'value', 'domain', 'path', 'secure', 'httpOnly',
+                                                       'sameSite'] if key in cookie}
+            if 'expiry' in cookie:
+                cdp_cookie['expires'] = cookie['expiry']
+            driver.execute_cdp_cmd('Network.setCookie', cdp_cookie)
+
+        # The local storage is filled by a script that runs before the scripts of every justwatch page
+        script = CONSENT_STORAGE_SCRIPT % (json.dumps(CONSENT_DOMAIN),
+                                           json.dumps(consent_state.get('local_storage', {})))
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': script})
+    except WebDriverException as e:
+        logging.debug(f'Could not restore consent state: {e}')
+        return False
+
+    return True
+
+class ManagedDriver:
+    """Chromedriver that is restarted after a number of pages or once its browser uses too much memory,
+    so long crawls keep a flat memory profile. Restarts only happen when a new page is opened.
+    The consent given on justwatch.com is stored, so new drivers do not see the consent pop-up.
+    Can be used like the webdriver it wraps and as context manager, which quits the driver.
+    """
+
+    def __init__(self, max_pages=None, max_rss_mb=None, consent_path=None, chromedriver_path=None):
+        """
+        Args:
+            max_pages (int, optional): Pages opened before the driver is restarted, defaults to the
+            driver_max_pages environment variable, else DEFAULT_MAX_PAGES
+            max_rss_mb (float, optional): Memory of the browser in MB above which the driver is restarted,
+            defaults to the driver_max_rss_mb environment variable, else DEFAULT_MAX_RSS_MB
+            consent_path (str, optional): Path of the stored consent state, None to use the default path
+            chromedriver_path (str, optional): Path of the chromedriver binary, None to use the default path
+        """
+        self.max_pages = max_pages or int(os.environ.get('driver_max_pages') or DEFAULT_MAX_PAGES)
+        self.max_rss_mb = max_rss_mb or float(os.environ.get('driver_max_rss_mb') or DEFAULT_MAX_RSS_MB)
+        self.consent_path = consent_path or get_default_consent_path()
+        self.chromedriver_path = chromedriver_path
+        self.driver = None
+        self.num_pages = 0
+        self.num_restarts = 0
+        self.consent_restored = False
+        self.start()
+
+    def start(self):
+        self.driver = create_chromedriver(self.chromedriver_path)
+        self.num_pages = 0
+
+        consent_state = load_consent_state(self.consent_path)
+        self.consent_restored = consent_state is not None and restore_consent_state(self.driver, consent_state)
+
+        return
+
+    def quit(self):
+        """Quits the driver, can be called more than once"""
+        driver, self.driver = self.driver, None
+        if driver is not None:
+            driver.quit()
+
+        return
+
+    def restart(self):
+        self.quit()
+        self.start()
+        self.num_restarts += 1
+
+        return
+
+    def get_rss_mb(self):
+        """Memory used by chromedriver and its browser in MB, None if it cannot be measured"""
+        try:
+            pid = self.driver.service.process.pid
+        except AttributeError:
+            return None
+
+        return get_process_tree_rss_mb(pid)
+
+    def needs_restart(self):
+        if self.num_pages >= self.max_pages:
+            logging.debug(f'Restarting chromedriver after {self.num_pages} pages...')
+            return True
+
+        # Memory is only measured every few pages, reading it takes a few milliseconds
+        if self.num_pages and self.num_pages % RSS_CHECK_INTERVAL == 0:
+            rss_mb = self.get_rss_mb()
+            if rss_mb is not None and rss_mb > self.max_rss_mb:
+                logging.debug(f'Restarting chromedriver using {rss_mb:.0f} MB after {self.num_pages} pages...')
+                return True
+
+        return False
+
+    def get(self, url):
+        """Opens a page, restarts the driver before if needed"""
+        if self.needs_restart():
+            self.restart()
+        self.num_pages += 1
+
+        return self.driver.get(url)
+
+    def save_consent_state(self):
+        """Stores the cookies and local storage of the open justwatch page after consent was given"""
+        state = {'cookies': self.driver.get_cookies(),
+                 'local_storage': self.driver.execute_script(
+                     'return Object.fromEntries(Object.entries(window.localStorage));')}
+
+        # Write to a temporary file of this process first, so an interrupted run or another process
+        # saving at the same time does not corrupt the state. A failed write must not fail the crawl.
+        temporary_path = None
+        try:
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(self.consent_path) or '.',
+                                                               suffix='.tmp')
+            with os.fdopen(file_descriptor, 'w') as f:
+                json.dump(state, f)
+            os.replace(temporary_path, self.consent_path)
+        except OSError as e:
+            logging.warning(f'Could not store consent state {self.consent_path}: {e}')
+            if temporary_path is not None and os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        return
+
+    def __getattr__(self, name):
+        # Everything else is handled by the wrapped webdriver
+        driver = self.__dict__.get('driver')
+        if driver is None:
+            raise AttributeError(f'{name} is not available, the chromedriver is not running')
+
+        return getattr(driver, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.quit()
+
+        return False
+
+def quit_drivers(drivers):
+    """Quits all drivers, even if quitting one of them fails"""
+    for driver in drivers:
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.debug(f'Could not quit chromedriver: {e}')
+
+    return
+
+class DriverPool:
+    """Main driver and worker drivers of a crawl. Used as context manager, all drivers are quit on exit,
+    also if the crawl fails. Without context manager, quit has to be called in a finally block.
+    """
+
+    def __init__(self, num_workers=1, **driver_options):
+        """
+        Args:
+            num_workers (int): Number of drivers to scrape the detail pages concurrently, no workers are started
+            for one worker as the main driver is used
+            **driver_options: Options passed to every ManagedDriver
+        """
+        self.num_workers = num_workers
+        self.driver_options = driver_options
+        self.driver = None
+        self.workers = []
+
+    def start(self):
+        """Starts all drivers in parallel, the started ones are quit if one of them fails
+
+        Returns:
+            DriverPool: The pool itself with the main driver and the workers
+        """
+        start_time = time.perf_counter()
+        num_drivers = 1 + (self.num_workers if self.num_workers > 1 else 0)
+
+        with ThreadPoolExecutor(max_workers=num_drivers) as executor:
+            futures = [executor.submit(ManagedDriver, **self.driver_options) for _ in range(num_drivers)]
+        drivers = [future.result() for future in futures if future.exception() is None]
+        if len(drivers) < num_drivers:
+            quit_drivers(drivers)
+            raise next(future.exception() for future in futures if future.exception() is not None)
+
+        self.driver, self.workers = drivers[0], drivers[1:]
+        logging.debug(f'Started {num_drivers} chromedrivers in {time.perf_counter() - start_time:.1f}s')
+
+        return self
+
+    def quit(self):
+        """Quits all drivers, can be called more than once"""
+        drivers = [driver for driver in [self.driver] + self.workers if driver is not None]
+        quit_drivers(drivers)
+        if drivers:
+            logging.debug(f'Quit {len(drivers)} chromedrivers, restarted '
+                          f'{sum(driver.num_restarts for driver in drivers)} times during the crawl')
+
+        return
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.quit()
+
+        return False
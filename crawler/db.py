@@ -1,17 +1,12 @@
-from pymongo import MongoClient
 from pymongo.operations import UpdateOne
-import os
+from pymongo import ASCENDING, DESCENDING
+from crawler import normalization
+from DB import connections
+import logging
 
 def connect_to_movie_collection():
-    # Connect to MovieReleases mongoDB
-    uri = os.environ.get('database_uri')
-    client = MongoClient(uri,
-                        tls=True,
-                        tlsCertificateKeyFile=os.environ.get('database_cert_path'))
-    db = client['movieReleases']
-    collection = db['movies']
-    
-    return collection
+    # Connect to MovieReleases mongoDB, the client is shared within the process
+    return connections.get_movie_collection()
 
 def create_bulk_upsert(clean_movie_list):
     
@@ -31,6 +26,107 @@ def create_bulk_upsert(clean_movie_list):
     
     return request_list
 
+def ensure_indexes(collection):
+    # Index for looking up already stored movies before scraping them
+    collection.create_index([('meta_country', ASCENDING), ('meta_provider', ASCENDING),
+                             ('date_added', ASCENDING), ('justwatch_link', ASCENDING)])
+    
+    # Index for the weekly top movies aggregation of the newsletter
+    collection.create_index([('date_added', ASCENDING), ('imdb_rating', DESCENDING)])
+    
+    return
+
+def load_known_movies(collection, countries, providers, dates):
+    """Loads the movies already stored for the dates in one batched query
+
+    Args:
+        collection (pymongo.collection.Collection): Movie collection
+        countries (list): List of countries
+        providers (list): List of providers
+        dates (list): List of dates in iso format
+
+    Returns:
+        set: Set of (link, provider, country, date) tuples of the stored movies
+    """
+    known_movies = collection.find(
+        {
+        'meta_country': {'$in': countries},
+        'meta_provider': {'$in': providers},
+        'date_added': {'$in': [normalization.parse_date(date) for date in dates]},
+        'justwatch_link': {'$exists': True},
+        },
+        {'_id': 0, 'justwatch_link': 1, 'meta_provider': 1, 'meta_country': 1, 'date_added': 1})
+    known_movie_index = {(movie['justwatch_link'], movie['meta_provider'], movie['meta_country'],
+                          movie['date_added'].date().isoformat()) for movie in known_movies}
+    
+    return known_movie_index
+
+def get_checkpoint_collection(collection):
+    # Checkpoints of the crawl units already persisted, stored next to the movies
+    return collection.database['crawlCheckpoints']
+
+def get_completed_units(checkpoint_collection, run_date):
+    """Gets the (country, provider) units that were already persisted in a run
+
+    Args:
+        checkpoint_collection (pymongo.collection.Collection): Checkpoint collection
+        run_date (str): Date of the run in iso format
+
+    Returns:
+        set: Set of (country, provider) tuples
+    """
+    checkpoints = checkpoint_collection.find({'run_date': run_date}, {'meta_country': 1, 'meta_provider': 1})
+    completed_units = {(checkpoint['meta_country'], checkpoint['meta_provider']) for checkpoint in checkpoints}
+    
+    return completed_units
+
+def mark_unit_completed(checkpoint_collection, run_date, country, provider, number_movies):
+    checkpoint_collection.update_one(
+        {'run_date': run_date, 'meta_country': country, 'meta_provider': provider},
+        {'$set': {'number_movies': number_movies}}, upsert=True)
+    
+    return
+
+def stream_upsert(collection, movie_batches, run_date, batch_size=100):
+    """Upserts movies into MongoDB while they are being scraped. Movies are flushed in batches of the
+    batch size and after every finished (country, provider) unit, which is then checkpointed.
+
+    Args:
+        collection (pymongo.collection.Collection): Movie collection
+        movie_batches (iterable): Iterable of (country, provider, movie list) tuples
+        run_date (str): Date of the run in iso format, used for the checkpoints
+        batch_size (int): Maximum number of upserts per bulk write
+
+    Returns:
+        dict: Number of upserted and matched documents
+    """
+    checkpoint_collection = get_checkpoint_collection(collection)
+    totals = {'upserted': 0, 'matched': 0}
+    request_list = []
+    
+    def flush():
+        nonlocal request_list
+        if request_list:
+            bulk_write_result = collection.bulk_write(request_list, ordered=False)
+            totals['upserted'] += bulk_write_result.upserted_count
+            totals['matched'] += bulk_write_result.matched_count
+            logging.debug(f'Upserted {bulk_write_result.upserted_count} documents, '
+                          f'{bulk_write_result.matched_count} were already in the DB.')
+        request_list = []
+    
+    for country, provider, movies in movie_batches:
+        for request in create_bulk_upsert(movies):
+            request_list.append(request)
+            if len(request_list) >= batch_size:
+                flush()
+        
+        # Persist everything of the unit before checkpointing it
+        flush()
+        mark_unit_completed(checkpoint_collection, run_date, country, provider, len(movies))
+        logging.debug(f'Persisted {len(movies)} movies from {provider} in {country}.')
+    
+    return totals
+
 def get_all_entries(collection):
     import pandas as pd
     
@@ -0,0 +1,53 @@
+class XPathCache:
+    """Memoized xpath generation for the elements of one BeautifulSoup document.
+    Xpaths and sibling positions are stored by node identity, so every node and every
+    list of children is only walked once. Keeps a reference to the soup so the node ids stay valid.
+    """
+
+    def __init__(self, soup):
+        self.soup = soup
+        self._xpaths = {}
+        self._steps = {}
+
+    def _get_step(self, node):
+        """Returns the xpath step of a node below its parent, e.g. 'div' or 'div[3]'"""
+        parent = node.parent
+        steps = self._steps.get(id(parent))
+        if steps is None:
+            # Count same-named siblings in one pass over the children of the parent
+            positions = {}
+            counts = {}
+            for child in parent.contents:
+                if child.name:
+                    counts[child.name] = counts.get(child.name, 0) + 1
+                    positions[id(child)] = (child.name, counts[child.name])
+            steps = {child_id: name if counts[name] == 1 else '%s[%d]' % (name, position)
+                     for child_id, (name, position) in positions.items()}
+            self._steps[id(parent)] = steps
+
+        return steps[id(node)]
+
+    def xpath(self, element):
+        """Generate xpath from BeautifulSoup4 element.
+
+        Args:
+            element (bs4.element.Tag or bs4.element.NavigableString): BeautifulSoup4 element
+
+        Returns:
+            str: xpath of the element
+        """
+        node = element if element.name else element.parent
+
+        # Walk up until the root or an ancestor with known xpath is reached
+        uncached_nodes = []
+        while node.parent is not None and id(node) not in self._xpaths:
+            uncached_nodes.append(node)
+            node = node.parent
+        xpath = self._xpaths.get(id(node), '')
+
+        # Build and store the xpaths of all nodes on the way back down
+        for node in reversed(uncached_nodes):
+            xpath = xpath + '/' + self._get_step(node)
+            self._xpaths[id(node)] = xpath
+
+        return xpath
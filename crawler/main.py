@@ -3,13 +3,14 @@ import os
 sys.path.append(os.environ.get('full_path'))
 
 from crawler import db
-from crawler import webcrawling
+from crawler import orchestration
 import logging
+import datetime
 
 # Configure logging
 
 
-def run_etl(days_backwards=1):
+def run_etl(days_backwards=1, num_workers=1, use_http=True, max_concurrency=4, streaming=True):
     
     logging.basicConfig(
     filename=os.environ.get('full_path') + '/logging/logger_new_movies.txt',
@@ -27,21 +28,47 @@ def run_etl(days_backwards=1):
         providers = ['Netflix', 'Amazon Prime Video', 'Disney Plus', 'Apple TV+']
         countries = ['Germany']
         
-        # Scrape current releases
-        logging.debug('Start webscraping...')
-        clean_movie_list = webcrawling.scrape_current_releases(countries, providers, days_backwards=days_backwards)
+        # Load movies already stored, these are not scraped again
+        db.ensure_indexes(mongo_db)
+        dates = [(datetime.date.today() - datetime.timedelta(days=t)).isoformat() for t in range(days_backwards + 1)]
+        known_movies = db.load_known_movies(mongo_db, countries, providers, dates)
+        logging.debug(f'Found {len(known_movies)} movies already stored.')
         
-        # Create bulk upsert request list
-        request_list = db.create_bulk_upsert(clean_movie_list)
+        # Scrape current releases and upsert them into MongoDB as soon as each provider is finished
+        if streaming:
+            run_date = datetime.date.today().isoformat()
+            checkpoint_collection = db.get_checkpoint_collection(mongo_db)
+            completed_units = db.get_completed_units(checkpoint_collection, run_date)
+            
+            logging.debug('Start webscraping...')
+            movie_batches = orchestration.iter_current_releases(countries, providers, max_concurrency=max_concurrency,
+                                                                skip_units=completed_units,
+                                                                days_backwards=days_backwards,
+                                                                num_workers=num_workers, use_http=use_http,
+                                                                known_movies=known_movies)
+            totals = db.stream_upsert(mongo_db, movie_batches, run_date)
+            logging.debug(f"Upserted {totals['upserted']} documents, {totals['matched']} were already in the DB.")
         
-        # Upsert data into MongoDB
-        number_movies = len(request_list)
-        if number_movies > 0:
-            logging.debug(f'Upserting {len(request_list)} movies into MongoDB...')
-            bulk_write_result= mongo_db.bulk_write(request_list, ordered=False)
-            logging.debug(f'Upserted {bulk_write_result.upserted_count} documents, {bulk_write_result.matched_count} were already in the DB.')
+        # Scrape all current releases first and upsert them at the end
         else:
-            logging.debug('No new movies found.')
+            # Scrape current releases
+            logging.debug('Start webscraping...')
+            clean_movie_list = orchestration.scrape_current_releases(countries, providers, max_concurrency=max_concurrency,
+                                                                     days_backwards=days_backwards,
+                                                                     num_workers=num_workers, use_http=use_http,
+                                                                     known_movies=known_movies)
+        
+            # Create bulk upsert request list
+            request_list = db.create_bulk_upsert(clean_movie_list)
+        
+            # Upsert data into MongoDB
+            number_movies = len(request_list)
+            if number_movies > 0:
+                logging.debug(f'Upserting {len(request_list)} movies into MongoDB...')
+                bulk_write_result= mongo_db.bulk_write(request_list, ordered=False)
+                logging.debug(f'Upserted {bulk_write_result.upserted_count} documents, {bulk_write_result.matched_count} were already in the DB.')
+            else:
+                logging.debug('No new movies found.')
 
         # Add logging
         logging.info('All good!')
@@ -56,4 +83,4 @@ def run_etl(days_backwards=1):
 
 
 if __name__ == '__main__':
-    run_etl(days_backwards=2)
\ No newline at end of file
+    run_etl(days_backwards=2, num_workers=2, max_concurrency=4)
\ No newline at end of file
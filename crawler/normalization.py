@@ -0,0 +1,166 @@
+import datetime
+import math
+import re
+import numpy as np
+import pandas as pd
+
+# Suffixes used by justwatch for the number of imdb ratings, e.g. '12k' or '1.2m'
+NUM_RATINGS_MULTIPLIERS = {'': 1, 'k': 1000, 'm': 1000000}
+NUM_RATINGS_PATTERN = re.compile(r'^\s*(?P<number>\d+(?:[.,]\d+)?)\s*(?P<suffix>[km]?)\s*$', re.IGNORECASE)
+RUNTIME_PATTERN = re.compile(r'^\s*(?:(?P<hours>\d+)\s*h)?\s*(?:(?P<minutes>\d+)\s*min)?\s*$')
+# Imdb score as shown by justwatch, e.g. '7.1 (12k)': rating before and number of ratings within the parentheses
+RATING_PATTERN = re.compile(r'^(?P<rating>[^(]*)(?:\((?P<num_ratings>.*)\)(?P<rest>.*))?$', re.DOTALL)
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value)) or value == ''
+
+def parse_num_ratings(value):
+    """Converts the number of imdb ratings to an int
+
+    Args:
+        value (str or int): Number of ratings as shown by justwatch, e.g. '12k'
+
+    Returns:
+        int: Number of ratings, None if missing or not parseable
+    """
+    if _is_missing(value):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    match = NUM_RATINGS_PATTERN.match(value)
+    if not match:
+        return None
+    number, suffix = match.groups()
+
+    return int(round(float(number.replace(',', '.')) * NUM_RATINGS_MULTIPLIERS[suffix.lower()]))
+
+def parse_runtime(value):
+    """Converts the runtime to minutes
+
+    Args:
+        value (str or int): Runtime as shown by justwatch, e.g. '1h 45min'
+
+    Returns:
+        int: Runtime in minutes, None if missing or not parseable
+    """
+    if _is_missing(value):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    match = RUNTIME_PATTERN.match(value)
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes = match.groups()
+
+    return int(hours or 0) * 60 + int(minutes or 0)
+
+def parse_rating(value):
+    """Converts the imdb rating to a float, None if missing or not parseable"""
+    if _is_missing(value):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def parse_year(value):
+    """Converts the release year to an int, None if missing or not parseable"""
+    if _is_missing(value):
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+def parse_date(value):
+    """Converts a date in iso format to a datetime (MongoDB has no date-only type)
+
+    Args:
+        value (str, datetime.date or datetime.datetime): Date
+
+    Returns:
+        datetime.datetime: Date at midnight, None if missing
+    """
+    if _is_missing(value):
+        return None
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+
+    return datetime.datetime.fromisoformat(value[:10])
+
+def format_runtime(minutes):
+    """Formats a runtime in minutes for display, e.g. '1h 45min'"""
+    if _is_missing(minutes):
+        return ''
+    if isinstance(minutes, str):
+        return minutes
+
+    hours, minutes = divmod(int(minutes), 60)
+    if not hours:
+        return f'{minutes}min'
+
+    return f'{hours}h {minutes}min' if minutes else f'{hours}h'
+
+def _split_strings(values):
+    """Separates the strings of a column, which are parsed by regex, from values that are numbers already
+
+    Returns:
+        tuple: Object series with the strings (NaN elsewhere) and float series with the other values truncated like
+        int() (NaN for strings and missing values)
+    """
+    values = values.astype(object)
+    is_string = values.map(type).eq(str)
+    numbers = pd.to_numeric(values.where(~is_string), errors='coerce').astype('float')
+
+    return values.where(is_string), np.trunc(numbers)
+
+def split_rating_series(ratings):
+    """Splits the imdb scores of a column into rating and number of ratings with one vectorized regex extract
+
+    Args:
+        ratings (pd.Series): Imdb scores as shown by justwatch, e.g. '7.1 (12k)'
+
+    Returns:
+        tuple: Ratings as float series and numbers of ratings as object series
+    """
+    strings, _ = _split_strings(ratings)
+    parts = strings.str.extract(RATING_PATTERN)
+    rating_texts = parts['rating'] + parts['rest'].fillna('')
+
+    return (pd.to_numeric(rating_texts, errors='coerce').astype('float'),
+            parts['num_ratings'].astype(object).where(parts['num_ratings'].notna(), None))
+
+def parse_num_ratings_series(values):
+    """parse_num_ratings for a whole column, the number and its k/m suffix are extracted and scaled vectorized
+
+    Returns:
+        pd.Series: Numbers of ratings as Int64 series
+    """
+    strings, numbers = _split_strings(values)
+    parts = strings.str.extract(NUM_RATINGS_PATTERN)
+    parsed = pd.to_numeric(parts['number'].str.replace(',', '.', regex=False), errors='coerce').astype('float')
+    num_ratings = (parsed * parts['suffix'].str.lower().map(NUM_RATINGS_MULTIPLIERS)).round()
+
+    # Values that are numbers already are kept
+    return num_ratings.fillna(numbers).astype('Int64')
+
+def parse_runtime_series(values):
+    """parse_runtime for a whole column, the hours and minutes are extracted and summed vectorized
+
+    Returns:
+        pd.Series: Runtimes in minutes as Int64 series
+    """
+    strings, numbers = _split_strings(values)
+    parts = strings.str.extract(RUNTIME_PATTERN)
+    hours = pd.to_numeric(parts['hours'], errors='coerce').astype('float')
+    minutes = pd.to_numeric(parts['minutes'], errors='coerce').astype('float')
+    # Strings without hours and minutes (e.g. '') are not parseable
+    runtimes = (hours.fillna(0) * 60 + minutes.fillna(0)).where(hours.notna() | minutes.notna())
+
+    # Values that are numbers already are kept
+    return runtimes.fillna(numbers).astype('Int64')
@@ -0,0 +1,126 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import webcrawling
+import mappings
+import logging
+import time
+
+
+def get_units(countries, providers, provider_mapping):
+    """Splits the crawl into (country, provider) units, only combinations covered by the mapping are kept"""
+    return [(country, provider) for country in countries for provider in providers
+            if provider in provider_mapping.get(country, {})]
+
+def _run_unit_with_retries(unit_function, unit, retries, kwargs):
+    """Runs one (country, provider) unit, retries it if it fails
+
+    Returns:
+        tuple: Result of the unit and the number of seconds it took
+    """
+    country, provider = unit
+    for attempt in range(retries + 1):
+        start_time = time.perf_counter()
+        try:
+            result = unit_function([country], [provider], **kwargs)
+            return result, time.perf_counter() - start_time
+        except Exception as e:
+            logging.info(f'Attempt {attempt + 1} for {provider} in {country} failed: {e}')
+            if attempt == retries:
+                raise
+
+def iter_units(unit_function, units, max_concurrency=4, retries=1, **kwargs):
+    """Runs (country, provider) units concurrently, each in its own process with its own chromedriver.
+    Results are yielded as soon as a unit finishes, a failing unit does not stop the other units.
+
+    Args:
+        unit_function (callable): Scrape function taking a country list and a provider list
+        units (list): List of (country, provider) tuples
+        max_concurrency (int): Maximum number of units running at the same time
+        retries (int): Number of retries per unit
+        kwargs: Keyword arguments passed on to the scrape function
+
+    Yields:
+        tuple: Unit and its result, None as result if the unit failed after all retries
+    """
+    with ProcessPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {executor.submit(_run_unit_with_retries, unit_function, unit, retries, kwargs): unit
+                   for unit in units}
+        for future in as_completed(futures):
+            country, provider = futures[future]
+            try:
+                result, elapsed_time = future.result()
+                logging.debug(f'Scraped {provider} in {country} in {elapsed_time:.1f}s')
+            except Exception as e:
+                result = None
+                logging.info(f'Scraping {provider} in {country} failed: {e}')
+            yield (country, provider), result
+
+def run_units(unit_function, units, max_concurrency=4, retries=1, **kwargs):
+    """Runs (country, provider) units concurrently, see iter_units
+
+    Returns:
+        dict: Dictionary with the unit as key and its result as value, failed units are left out
+        list: List of units that failed after all retries
+    """
+    results = {}
+    failed_units = []
+    for unit, result in iter_units(unit_function, units, max_concurrency, retries, **kwargs):
+        if result is None:
+            failed_units.append(unit)
+        else:
+            results[unit] = result
+
+    return results, failed_units
+
+def iter_current_releases(countries, providers, max_concurrency=4, retries=1, skip_units=(), **kwargs):
+    """Scrapes the current releases with one process per (country, provider) unit and yields
+    the movies of each unit as soon as it is finished. Failed units are not yielded.
+
+    Args:
+        skip_units (iterable): (country, provider) tuples that are already scraped and should be skipped
+
+    Yields:
+        tuple: country, provider and list of dictionaries containing the scraped movies
+    """
+    units = [unit for unit in get_units(countries, providers, mappings.country_provider_dict)
+             if unit not in skip_units]
+    for (country, provider), movies in iter_units(webcrawling.scrape_current_releases, units, max_concurrency,
+                                                  retries, **kwargs):
+        if movies is not None:
+            yield country, provider, movies
+
+def scrape_current_releases(countries, providers, max_concurrency=4, retries=1, **kwargs):
+    """Scrapes the current releases of all countries and providers with one process per (country, provider) unit
+
+    Args:
+        countries (list): List of countries that releases should be scraped for
+        providers (list): List of providers that releases should be scraped for
+        max_concurrency (int): Maximum number of units running at the same time
+        retries (int): Number of retries per unit
+        kwargs: Keyword arguments passed on to webcrawling.scrape_current_releases
+
+    Returns:
+        list: List of dictionaries containing the scraped movies of all successful units
+    """
+    units = get_units(countries, providers, mappings.country_provider_dict)
+    results, failed_units = run_units(webcrawling.scrape_current_releases, units, max_concurrency, retries, **kwargs)
+
+    # Merge results in the order of the units
+    country_provider_movies = [movie for unit in units if unit in results for movie in results[unit]]
+
+    return country_provider_movies
+
+def scrape_top_releases(countries, providers, max_concurrency=4, retries=1, **kwargs):
+    """Scrapes the top releases of all countries and providers with one process per (country, provider) unit
+
+    Returns:
+        pd.DataFrame: Combined dataframe of the best movies of all successful units
+    """
+    units = get_units(countries, providers, mappings.country_provider_topmovies_dict)
+    results, failed_units = run_units(webcrawling.scrape_top_releases, units, max_concurrency, retries, **kwargs)
+
+    # Merge results in the order of the units
+    best_movie_dfs = [results[unit] for unit in units if unit in results]
+    combined_best_movie_df = pd.concat(best_movie_dfs) if best_movie_dfs else pd.DataFrame()
+
+    return combined_best_movie_df
@@ -0,0 +1,183 @@
+from bs4 import BeautifulSoup
+import logging
+import os
+import re
+
+# lxml parses in C and is much faster than html.parser, BeautifulSoup is used if it is not installed
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    etree = None
+
+# Fields extracted from a detail page
+DETAIL_FIELDS = ['name', 'release_year', 'imdb_link', 'imdb_rating', 'runtime', 'flatrate_links']
+FLATRATE_ICON_CLASS = 'presentation-type price-comparison__grid__row__element__icon'
+
+# Blocks every rendered detail page contains, the values within them (e.g. the imdb score) are optional
+REQUIRED_BLOCK_PATTERNS = {
+    block: re.compile(r'class=["\'](?:[^"\']*\s)?' + block + r'[\s"\']')
+    for block in ['title-block', 'price-comparison--block']
+}
+
+
+def find_missing_blocks(html):
+    """Returns the required blocks whose class does not occur in the html, checked without parsing it"""
+    return [block for block, pattern in REQUIRED_BLOCK_PATTERNS.items() if not pattern.search(html)]
+
+def parse_detail_page_bs4(html):
+    """Extracts the movie information from the html of a detail page with BeautifulSoup
+
+    Args:
+        html (str): html of the justwatch detail page
+
+    Returns:
+        dict: Dictionary with the DETAIL_FIELDS, empty values if not available
+    """
+    soup = BeautifulSoup(html, features="html.parser")
+
+    # Extract movie information, if available
+    try:
+        name = soup.find('div', class_='title-block').find('h1').text
+    except:
+        name = ''
+    try:
+        release_year = soup.find('div', class_='title-block').find('span').text
+    except:
+        release_year = ''
+    try:
+        imdb_link = soup.find('div', attrs={'v-uib-tooltip': 'IMDB'}).next_element.get('href')
+    except:
+        imdb_link = ''
+    try:
+        imdb_rating = soup.find('div', attrs={'v-uib-tooltip': 'IMDB'}).text
+    except:
+        imdb_rating = ''
+    try:
+        runtime = soup.find('div', text='Laufzeit').next_sibling.text
+    except:
+        runtime = ''
+
+    # Get all flatrate streaming links
+    try:
+        streaming_links= (soup.find('div', class_='price-comparison--block')
+                        .find_all('div', class_=FLATRATE_ICON_CLASS))
+        flatrate_links = []
+        for link in streaming_links:
+            if 'Flat' in link.text:
+                href = link.next.get('href')
+                flatrate_links.append(href)
+    except:
+        flatrate_links = []
+
+    return {'name': name, 'release_year': release_year, 'imdb_link': imdb_link, 'imdb_rating': imdb_rating,
+            'runtime': runtime, 'flatrate_links': flatrate_links}
+
+if etree is not None:
+    # Selectors are compiled once. All blocks are found in one pass over the divs of the document,
+    # the fields are only searched within their block.
+    RUNTIME_LABEL_CONDITION = "count(node()) = 1 and string(.) = 'Laufzeit'"
+    BLOCKS_XPATH = etree.XPath(
+        "//div[contains(concat(' ', normalize-space(@class), ' '), ' title-block ')"
+        " or @v-uib-tooltip = 'IMDB'"
+        " or contains(concat(' ', normalize-space(@class), ' '), ' price-comparison--block ')"
+        f" or ({RUNTIME_LABEL_CONDITION})]")
+    IS_RUNTIME_LABEL_XPATH = etree.XPath(RUNTIME_LABEL_CONDITION)
+    NAME_XPATH = etree.XPath("(.//h1)[1]")
+    RELEASE_YEAR_XPATH = etree.XPath("(.//span)[1]")
+    FLATRATE_ICONS_XPATH = etree.XPath(".//div[@class = $icon_class]")
+
+def _first_child_href(element):
+    """href of the first child node like next_element.get('href') in BeautifulSoup, raises if it is text"""
+    if element.text or (not len(element) and element.tail):
+        raise AttributeError('First child is text')
+    first_child = element[0] if len(element) else element.getnext()
+    if first_child is None or not isinstance(first_child.tag, str):
+        raise AttributeError('First child is no element')
+
+    return first_child.get('href')
+
+def _text(element):
+    return element.text_content() if element is not None else ''
+
+def parse_detail_page_lxml(html):
+    """Extracts the movie information from the html of a detail page in one parse with lxml.
+    Returns the same values as parse_detail_page_bs4.
+
+    Args:
+        html (str): html of the justwatch detail page
+
+    Returns:
+        dict: Dictionary with the DETAIL_FIELDS, empty values if not available
+    """
+    try:
+        document = lxml_html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return {field: [] if field == 'flatrate_links' else '' for field in DETAIL_FIELDS}
+
+    # First div of each block, a div can be more than one block
+    blocks = {}
+    for div in BLOCKS_XPATH(document):
+        classes = (div.get('class') or '').split()
+        if 'title-block' in classes:
+            blocks.setdefault('title', div)
+        if div.get('v-uib-tooltip') == 'IMDB':
+            blocks.setdefault('score', div)
+        if 'price-comparison--block' in classes:
+            blocks.setdefault('price', div)
+        if 'runtime_label' not in blocks and IS_RUNTIME_LABEL_XPATH(div):
+            blocks.setdefault('runtime_label', div)
+
+    # Title block with name and release year
+    title_block = blocks.get('title')
+    name = _text(next(iter(NAME_XPATH(title_block)), None)) if title_block is not None else ''
+    release_year = _text(next(iter(RELEASE_YEAR_XPATH(title_block)), None)) if title_block is not None else ''
+
+    # Score block with link and rating
+    score_block = blocks.get('score')
+    try:
+        imdb_link = _first_child_href(score_block) if score_block is not None else ''
+    except AttributeError:
+        imdb_link = ''
+    imdb_rating = _text(score_block)
+
+    # Runtime is the sibling following the label
+    runtime_label = blocks.get('runtime_label')
+    runtime = ''
+    if runtime_label is not None:
+        runtime = runtime_label.tail if runtime_label.tail else _text(runtime_label.getnext())
+
+    # Flatrate links of the price comparison block
+    flatrate_links = []
+    price_block = blocks.get('price')
+    if price_block is not None:
+        try:
+            for icon in FLATRATE_ICONS_XPATH(price_block, icon_class=FLATRATE_ICON_CLASS):
+                if 'Flat' in icon.text_content():
+                    flatrate_links.append(_first_child_href(icon))
+        except AttributeError:
+            flatrate_links = []
+
+    return {'name': name, 'release_year': release_year, 'imdb_link': imdb_link, 'imdb_rating': imdb_rating,
+            'runtime': runtime, 'flatrate_links': flatrate_links}
+
+# Available detail page parsers
+DETAIL_PARSERS = {'bs4': parse_detail_page_bs4}
+if etree is not None:
+    DETAIL_PARSERS['lxml'] = parse_detail_page_lxml
+
+def get_detail_parser(name=None):
+    """Returns the detail page parser
+
+    Args:
+        name (str, optional): Name of the parser, defaults to the detail_parser environment variable,
+        else lxml if installed
+
+    Returns:
+        callable: Parser taking the html and returning the detail fields
+    """
+    name = name or os.environ.get('detail_parser') or ('lxml' if 'lxml' in DETAIL_PARSERS else 'bs4')
+    if name not in DETAIL_PARSERS:
+        logging.debug(f'Detail parser {name} not available, using bs4')
+        name = 'bs4'
+
+    return DETAIL_PARSERS[name]
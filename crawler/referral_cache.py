@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+import time
+import os
+
+# Resolved links are kept for 30 days, links that could not be resolved are retried after one day
+DEFAULT_TTL = 30 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60
+
+
+def get_default_cache_path():
+    return os.environ.get('full_path') + '/crawler/referral_cache.db'
+
+class ReferralCache:
+    """On-disk cache from referral links to the resolved provider links.
+    Links that never resolved are stored with an empty resolved url (negative caching).
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path or get_default_cache_path()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS referrals ('
+            'link TEXT PRIMARY KEY, '
+            'resolved_url TEXT, '
+            'resolved_at REAL NOT NULL)')
+        self._connection.commit()
+
+    def get_many(self, links):
+        """Looks up links in the cache
+
+        Args:
+            links (list): List of referral links
+
+        Returns:
+            dict: Dictionary with the link as key and the resolved url as value, None if the link
+            is known to not resolve. Links without valid cache entry are left out.
+        """
+        links = list(set(links))
+        if not links:
+            return {}
+
+        now = time.time()
+        cached_links = {}
+        with self._lock:
+            # Query in chunks to stay below the sqlite variable limit
+            for i in range(0, len(links), 500):
+                chunk = links[i:i+500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._connection.execute(
+                    f'SELECT link, resolved_url, resolved_at FROM referrals WHERE link IN ({placeholders})',
+                    chunk).fetchall()
+                for link, resolved_url, resolved_at in rows:
+                    ttl = self.ttl if resolved_url else self.negative_ttl
+                    if now - resolved_at < ttl:
+                        cached_links[link] = resolved_url or None
+
+        return cached_links
+
+    def set_many(self, resolved_links):
+        """Stores resolved links in the cache
+
+        Args:
+            resolved_links (dict): Dictionary with the link as key and the resolved url as value,
+            None if the link could not be resolved
+        """
+        now = time.time()
+        rows = [(link, resolved_url or '', now) for link, resolved_url in resolved_links.items()]
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO referrals (link, resolved_url, resolved_at) VALUES (?, ?, ?)', rows)
+            self._connection.commit()
+
+        return
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+        return
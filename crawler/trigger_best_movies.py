@@ -1,4 +1,4 @@
-import webcrawling
+import orchestration
 import sys, os
 import logging
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
@@ -15,7 +15,9 @@ def trigger():
     try:
         providers = ['Netflix', 'Amazon Prime Video']
         countries = ['Germany']
-        best_movie_df = webcrawling.scrape_top_releases(countries=countries, providers=providers)
+        known_links = crud.load_known_movie_links(providers, countries)
+        best_movie_df = orchestration.scrape_top_releases(countries=countries, providers=providers, max_concurrency=2,
+                                                          num_workers=2, use_http=True, known_links=known_links)
         crud.upload_movies_from_dataframe(best_movie_df)
         
         # Add logging
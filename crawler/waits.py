@@ -0,0 +1,113 @@
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from collections import defaultdict
+import threading
+import logging
+import time
+
+# Durations of all waits, keyed by the name of the wait
+wait_metrics = defaultdict(list)
+_metrics_lock = threading.Lock()
+
+# Returns the last button within the shadow roots of the page (the accept-all button of the consent pop-up),
+# checks the page once without waiting for it to be loaded completely
+SHADOW_BUTTON_SCRIPT = """
+function findButtons(root) {
+    let buttons = [];
+    for (const element of root.querySelectorAll('*')) {
+        if (element.shadowRoot) {
+            buttons = buttons.concat(Array.from(element.shadowRoot.querySelectorAll('button')),
+                                     findButtons(element.shadowRoot));
+        }
+    }
+    return buttons;
+}
+const buttons = findButtons(document);
+return buttons.length ? buttons[buttons.length - 1] : null;
+"""
+
+
+def wait_until(driver, condition, name, timeout=10, poll_frequency=0.1):
+    """Waits until a condition is met instead of sleeping for a fixed time. The time waited
+    is recorded in the wait metrics.
+
+    Args:
+        driver (webdriver): chrome driver instance
+        condition (callable): Function taking the driver, returns a truthy value once the condition is met
+        name (str): Name of the wait used for the metrics
+        timeout (float): Maximum number of seconds to wait
+        poll_frequency (float): Number of seconds between two checks of the condition
+
+    Returns:
+        Return value of the condition, None if the condition was not met before the timeout
+    """
+    start_time = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=poll_frequency).until(condition)
+        timed_out = False
+    except TimeoutException:
+        result = None
+        timed_out = True
+
+    elapsed_time = time.perf_counter() - start_time
+    with _metrics_lock:
+        wait_metrics[name].append((elapsed_time, timed_out))
+
+    return result
+
+def get_wait_summary():
+    """Summarizes the recorded waits
+
+    Returns:
+        dict: Dictionary with the wait name as key and count, timeouts, mean, max and total seconds as values
+    """
+    with _metrics_lock:
+        metrics = {name: list(waits) for name, waits in wait_metrics.items()}
+
+    summary = {}
+    for name, waits in metrics.items():
+        durations = [duration for duration, _ in waits]
+        summary[name] = {
+            'count': len(waits),
+            'timeouts': sum(timed_out for _, timed_out in waits),
+            'mean': sum(durations) / len(durations),
+            'max': max(durations),
+            'total': sum(durations),
+        }
+
+    return summary
+
+def log_wait_summary():
+    for name, stats in get_wait_summary().items():
+        logging.debug(f"Wait '{name}': {stats['count']} waits, {stats['timeouts']} timeouts, "
+                      f"mean {stats['mean']:.2f}s, max {stats['max']:.2f}s, total {stats['total']:.1f}s")
+
+    return
+
+def consent_button_present(driver):
+    """Condition that returns the accept-all button of the consent pop-up once it is rendered in the shadow DOM.
+    Every check returns immediately, so the timeout of the wait is kept also while the page is still loading.
+    """
+    try:
+        button = driver.execute_script(SHADOW_BUTTON_SCRIPT)
+    except WebDriverException:
+        # e.g. while the page is still being replaced
+        return False
+
+    return button or False
+
+def element_count_greater_than(css_selector, count):
+    """Condition that returns the number of elements matching the selector once it is greater than count"""
+    def condition(driver):
+        current_count = driver.execute_script('return document.querySelectorAll(arguments[0]).length;', css_selector)
+        return current_count if current_count > count else False
+
+    return condition
+
+def url_changed_from(url):
+    """Condition that returns the current url once it differs from url"""
+    def condition(driver):
+        current_url = driver.current_url
+        return current_url if current_url != url else False
+
+    return condition
@@ -2,45 +2,54 @@ from selenium import webdriver
 from bs4 import BeautifulSoup
 import re
 import time 
-from pyshadow.main import Shadow
 import datetime
 import pandas as pd
+import browser
 import mappings
+import normalization
+import parsers
+import referral_cache
+import waits
+from locators import XPathCache
 import logging
-import os
+import queue
+import random
+from concurrent.futures import ThreadPoolExecutor
 
 # Selenium modules
 from selenium.webdriver.common.action_chains import ScrollOrigin
-from selenium.webdriver.chrome.options import Options 
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import NoSuchElementException, ElementNotInteractableException
 
+# Settings for fetching detail pages without browser
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0 Safari/537.36',
+    'Accept-Language': 'de-DE,de;q=0.9,en;q=0.8',
+}
+HTTP_TIMEOUT = 15
+
+# Returns the links of the items loaded in one timeline without serializing the whole page
+TIMELINE_ITEMS_SCRIPT = """
+const timeline = document.querySelectorAll('div.provider-timeline')[arguments[0]];
+const items = timeline.querySelectorAll('div.horizontal-title-list__item');
+const hrefs = Array.from(items, item => {
+    const link = item.querySelector(':scope > a');
+    return link ? link.getAttribute('href') : null;
+});
+return {'hrefs': hrefs, 'last_item': items.length ? items[items.length - 1] : null};
+"""
+
+# Returns the links of the top movies grid items loaded after the first n items
+GRID_ITEM_SELECTOR = 'div.title-list-grid__item'
+GRID_ITEMS_SCRIPT = """
+const items = Array.from(document.querySelectorAll(arguments[0])).slice(arguments[1]);
+return items.map(item => {
+    const link = item.querySelector(':scope > a');
+    return link ? link.getAttribute('href') : null;
+});
+"""
 
 
-def xpath_soup(element):
-
-    """
-    Generate xpath from BeautifulSoup4 element.
-    :param element: BeautifulSoup4 element.
-    :type element: bs4.element.Tag or bs4.element.NavigableString
-    :return: xpath as string
-    :rtype: str
-    """
-    
-    components = []
-    child = element if element.name else element.parent
-    for parent in child.parents:  # type: bs4.element.Tag
-        siblings = parent.find_all(child.name, recursive=False)
-        components.append(
-            child.name if 1 == len(siblings) else '%s[%d]' % (
-                child.name,
-                next(i for i, s in enumerate(siblings, 1) if s is child)
-                )
-            )
-        child = parent
-    components.reverse()
-    return '/%s' % '/'.join(components)
-
 def check_exists_by_xpath(xpath, driver):
     """
     Helper function that checks whether an element exists on the page
@@ -51,28 +60,84 @@ def check_exists_by_xpath(xpath, driver):
         return False
     return True
 
+def get_dates(days_backwards=1):
+    """Returns todays date and the dates of the days in the past in iso format"""
+    today = datetime.date.today().isoformat()
+    dates = [today]
+    for i in range(days_backwards):
+        t = i+1
+        date_minus_t = (datetime.date.today() - datetime.timedelta(days=t)).isoformat()
+        dates.append(date_minus_t)
+    
+    return dates
+
+def remove_known_links(movie_link_dict, known_movies, country, provider):
+    """Removes links of movies that are already stored from the movie link dict
+
+    Args:
+        movie_link_dict (dict): Dictionary containing the movie links for each date
+        known_movies (set): Set of already stored (link, provider, country, date) tuples
+        country (str): country of the movie links
+        provider (str): provider of the movie links
+
+    Returns:
+        dict: Dictionary containing only the unseen movie links for each date, dates without links are dropped
+    """
+    new_movie_link_dict = {}
+    for date, links in movie_link_dict.items():
+        new_links = [link for link in links if (link, provider, country, date) not in known_movies]
+        if new_links:
+            new_movie_link_dict[date] = new_links
+    
+    num_links = sum(len(links) for links in movie_link_dict.values())
+    num_new_links = sum(len(links) for links in new_movie_link_dict.values())
+    logging.debug(f'Skipping {num_links - num_new_links} of {num_links} movies, already stored...')
+    
+    return new_movie_link_dict
+
+def get_timeline_items(driver, timeline_index):
+    """Reads the relative links of all items currently loaded in one timeline
+
+    Args:
+        driver (obj): chromedriver
+        timeline_index (int): Position of the timeline on the page
+
+    Returns:
+        dict: 'hrefs' with the relative links (None for items without link) and 'last_item' with the
+        last item element
+    """
+    return driver.execute_script(TIMELINE_ITEMS_SCRIPT, timeline_index)
+
+def wait_for_new_timeline_items(driver, timeline_index, num_items_seen, timeout=5):
+    """Waits until the timeline contains more items than already seen
+
+    Returns:
+        dict: Timeline items as returned by get_timeline_items, None if no new items were loaded
+    """
+    def new_items_loaded(driver):
+        timeline_items = get_timeline_items(driver, timeline_index)
+        return timeline_items if len(timeline_items['hrefs']) > num_items_seen else False
+    
+    return waits.wait_until(driver, new_items_loaded, 'timeline_scroll', timeout=timeout)
+
 def get_timeline_links(driver, days_backwards=1):
     """Gets the movie links from the timeline for todays + days in the past as specified
 
     Args:
-        soup (obj): beatufulsoup from justwatch html
         driver (obj): chromedriver
+        days_backwards (int): Number of days in the past to consider
 
     Returns:
         dict: dictionary with dates as key and link lists as values
     """
     
     # Defines dates
-    today = datetime.date.today().isoformat()
-    dates = [today]
-    for i in range(days_backwards):
-        t = i+1
-        date_minus_t = (datetime.date.today() - datetime.timedelta(days=t)).isoformat()
-        dates.append(date_minus_t)
+    dates = get_dates(days_backwards)
     
     # Get HTML page
     html = driver.page_source
     soup = BeautifulSoup(html, features="html.parser")
+    xpath_cache = XPathCache(soup)
     
     # initialize movie dict
     movie_dict = {}
@@ -88,105 +153,136 @@ def get_timeline_links(driver, days_backwards=1):
             num_movies = int(re.search('(\d+)',time_line.text).group(1))
             
             # Get scroll-right element and scroll to the right until all moviel are loaded
-            scrollbar_xpath = xpath_soup(item_scrollbar)
-            scrollbar_driver = driver.find_element(By.XPATH,scrollbar_xpath)
+            scrollbar_xpath = xpath_cache.xpath(item_scrollbar)
+            scrollbar_driver = driver.find_element(By.XPATH, scrollbar_xpath)
             scroll_origin = ScrollOrigin.from_element(scrollbar_driver)
             action = webdriver.ActionChains(driver)
             action.scroll_from_origin(scroll_origin,1920,0).perform()
             
-            movie_links = []
-            all_movies_covered = False
+            # Collect links incrementally, only the items of this timeline are read after each scroll
+            movie_links = {}
+            num_items_seen = 0
+            while True:
+                timeline_items = wait_for_new_timeline_items(driver, n, num_items_seen)
+                if timeline_items is None:
+                    logging.debug(f'No new movies loaded for {date}, found {len(movie_links)} of {num_movies}...')
+                    break
+                
+                # Add all movie links available, keep order of the timeline
+                for rel_link in timeline_items['hrefs']:
+                    if rel_link:
+                        movie_links['https://www.justwatch.com' + rel_link] = None
+                num_items_seen = len(timeline_items['hrefs'])
+                num_missing_links = timeline_items['hrefs'].count(None)
+
+                # Check if all movies covered - if not scroll further, use last movie as scroll origin
+                if len(movie_links) + num_missing_links >= num_movies:
+                    break
+                scroll_origin = ScrollOrigin.from_element(timeline_items['last_item'])
+                action = webdriver.ActionChains(driver)
+                action.scroll_from_origin(scroll_origin,1920,0).perform()
             
-            fail_counter = 0
-            while not all_movies_covered:
-                # Add all movie links available
-                for movie in time_line.findAll('div', class_='horizontal-title-list__item'):
-                    try:
-                        rel_link = movie.find("a", recursive=False)['href']
-                        full_link = 'https://www.justwatch.com' + rel_link
-                        movie_links.append(full_link)
-                    except:
-                        fail_counter += 1
-
-                # Check if all movies covered - if not scroll further
-                if len(movie_links) + fail_counter >= num_movies:
-                    all_movies_covered=True
-                else:
-                    movie_links = []
-                    movie_xpath = xpath_soup(movie) # use last movie as scroll origin
-                    movie_driver = driver.find_element(By.XPATH,movie_xpath)
-                    scroll_origin = ScrollOrigin.from_element(movie_driver)
-                    action = webdriver.ActionChains(driver)
-                    action.scroll_from_origin(scroll_origin,1920,0).perform()
-                    
-                    # Reload html after scrolling
-                    html = driver.page_source
-                    soup = BeautifulSoup(html, features="html.parser")
-                    time_line = soup.findAll('div', class_='provider-timeline')[n]
+            movie_links = list(movie_links)
                     
             # Add links with date key
             movie_dict[date] = movie_links
     
     return movie_dict
 
+def parse_movie_details(html, date, parser=None):
+    """Extracts the movie information from the html of a movie detail page
+
+    Args:
+        html (str): html of the justwatch detail page
+        date (str): date the movie was added
+        parser (str, optional): Name of the detail page parser, see parsers.get_detail_parser
+
+    Returns:
+        dict: Dictionary containing the movie details
+    """
+    detail_fields = parsers.get_detail_parser(parser)(html)
+    
+    # Fill movie detail dict
+    movie_detail_dict = {'date_added': date}
+    movie_detail_dict.update(detail_fields)
+    
+    return movie_detail_dict
+
 def extract_movie_details_from_link(link, driver, date):
     driver.get(link)
     html = driver.page_source
-    soup = BeautifulSoup(html, features="html.parser")
     
-    movie_detail_dict = {}
-    date_added = date
+    movie_detail_dict = parse_movie_details(html, date)
+    movie_detail_dict['justwatch_link'] = link
     
-    # Extract movie information, if available
-    try:
-        name = soup.find('div', class_='title-block').find('h1').text
-    except:
-        name = ''
-    try:
-        release_year = soup.find('div', class_='title-block').find('span').text
-    except:
-        release_year = ''
-    try:
-        imdb_link = soup.find('div', attrs={'v-uib-tooltip': 'IMDB'}).next_element.get('href')
-    except:
-        imdb_link = ''
-    try:
-        imdb_rating = soup.find('div', attrs={'v-uib-tooltip': 'IMDB'}).text
-    except:
-        imdb_rating = ''
-    try:
-        runtime = soup.find('div', text='Laufzeit').next_sibling.text
-    except:
-        runtime = ''
+    return movie_detail_dict
+
+def set_up_http_session(pool_size=10):
+    """Sets up a keep-alive http session with a connection pool for the justwatch detail pages
+
+    Args:
+        pool_size (int): Number of connections kept open per host
+
+    Returns:
+        requests.Session: http session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount('https://', adapter)
+    session.headers.update(HTTP_HEADERS)
     
-    # Get all flatrate streaming links 
+    return session
+
+def extract_movie_details_from_link_http(link, session, date, driver=None):
+    """Gets the movie details from the server-rendered html of the detail page. Falls back
+    to rendering the page with the chromedriver if the page could not be fetched or a required block
+    (title or price comparison) is missing. Empty values within the blocks, e.g. no imdb score yet, are kept.
+
+    Args:
+        link (str): Link to the justwatch detail page
+        session (requests.Session): http session
+        date (str): date the movie was added
+        driver (webdriver, optional): chrome driver instance used as fallback
+
+    Returns:
+        dict: Dictionary containing the movie details
+    """
     try:
-        streaming_links= (soup.find('div', class_='price-comparison--block')
-                        .find_all('div', class_='presentation-type price-comparison__grid__row__element__icon'))
-        flatrate_links = []
-        for link in streaming_links:
-            if 'Flat' in link.text:
-                href = link.next.get('href')
-                flatrate_links.append(href)
-    except:
-        flatrate_links = []
-                
-    # Fill movie detail dict
-    movie_detail_dict['date_added'] = date_added
-    movie_detail_dict['name'] = name
-    movie_detail_dict['release_year'] = release_year
-    movie_detail_dict['imdb_link'] = imdb_link
-    movie_detail_dict['imdb_rating'] = imdb_rating
-    movie_detail_dict['runtime'] = runtime
-    movie_detail_dict['flatrate_links'] = flatrate_links
+        response = session.get(link, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        html = response.text
+    except Exception as e:
+        logging.debug(f'Http fetch of {link} failed: {e}')
+        html = ''
+    
+    # Render page with selenium if the html does not contain all blocks
+    missing_blocks = parsers.find_missing_blocks(html)
+    if missing_blocks and driver is not None:
+        logging.debug(f'Missing {missing_blocks} for {link}, falling back to chromedriver...')
+        return extract_movie_details_from_link(link, driver, date)
+    
+    movie_detail_dict = parse_movie_details(html, date)
+    movie_detail_dict['justwatch_link'] = link
     
     return movie_detail_dict
 
-def extract_movie_details(movie_link_dict, driver):
+def fetch_movie_details(link, driver, date, session=None):
+    """Gets the movie details via http if a session is provided, else via the chromedriver"""
+    if session is not None:
+        return extract_movie_details_from_link_http(link, session, date, driver)
+    
+    return extract_movie_details_from_link(link, driver, date)
+
+def extract_movie_details(movie_link_dict, driver, session=None):
     """Scrapes movie detail pages and extracts movie information
 
     Args:
         movie_link_dict (dict): Dictionary containing the movie links for each date
+        driver (webdriver): chrome driver instance
+        session (requests.Session, optional): http session used to fetch the pages without browser
 
     Returns:
         dict: Dictionary containing the movie details for each date
@@ -201,13 +297,74 @@ def extract_movie_details(movie_link_dict, driver):
         
         # Open detail pages of the movies
         for link in links:
-            movie_detail_dict = extract_movie_details_from_link(link, driver, date)
+            movie_detail_dict = fetch_movie_details(link, driver, date, session)
                         
             # Append to movies detail dict
             movies_detail_dict[date].append(movie_detail_dict)
     
     return movies_detail_dict
 
+def _run_detail_worker(worker_id, driver, job_queue, results, session=None):
+    """Works through the shared job queue on one driver until it is empty
+
+    Args:
+        worker_id (int): Number of the worker, used for logging
+        driver (webdriver): chrome driver instance owned by this worker
+        job_queue (queue.Queue): Queue of (position, date, link) jobs
+        results (dict): Dictionary the movie details are written to, keyed by position
+        session (requests.Session, optional): http session shared by all workers
+    """
+    start_time = time.perf_counter()
+    pages_scraped = 0
+    
+    while True:
+        try:
+            position, date, link = job_queue.get_nowait()
+        except queue.Empty:
+            break
+        results[position] = fetch_movie_details(link, driver, date, session)
+        pages_scraped += 1
+    
+    elapsed_time = time.perf_counter() - start_time
+    logging.debug(f'Worker {worker_id} scraped {pages_scraped} pages in {elapsed_time:.1f}s')
+    
+    return
+
+def extract_movie_details_with_pool(movie_link_dict, drivers, session=None):
+    """Scrapes movie detail pages concurrently, one worker per driver in the pool
+
+    Args:
+        movie_link_dict (dict): Dictionary containing the movie links for each date
+        drivers (list): List of chromedriver instances, one per worker
+        session (requests.Session, optional): http session used to fetch the pages without browser
+
+    Returns:
+        dict: Dictionary containing the movie details for each date
+    """
+    # Put all (date, link) jobs on one shared queue, remember their position to keep the order
+    job_queue = queue.Queue()
+    positions = {}
+    for date, links in movie_link_dict.items():
+        positions[date] = []
+        for link in links:
+            position = job_queue.qsize()
+            job_queue.put((position, date, link))
+            positions[date].append(position)
+    
+    # Let every driver work through the queue, the pool size bounds the concurrency
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(drivers)) as executor:
+        futures = [executor.submit(_run_detail_worker, worker_id, driver, job_queue, results, session)
+                   for worker_id, driver in enumerate(drivers)]
+        for future in futures:
+            future.result()
+    
+    # Bring results back into the same shape as extract_movie_details
+    movies_detail_dict = {date: [results[position] for position in date_positions]
+                          for date, date_positions in positions.items()}
+    
+    return movies_detail_dict
+
 def remove_referral(link, driver):
     """Remove referral link by opening link and extracting the goal link.
 
@@ -221,17 +378,82 @@ def remove_referral(link, driver):
     
     # Open link provided
     driver.get(link)
-    new_url = driver.current_url
     
-    # Check if new url is different from old one (max 10 tries, else return old url)
-    counter = 0
-    while new_url == link and counter < 10:
-        time.sleep(1)
-        new_url = driver.current_url
-        counter += 1
+    # Wait until the url changes (max 10 seconds, else return old url)
+    new_url = waits.wait_until(driver, waits.url_changed_from(link), 'referral_redirect', timeout=10)
+    if new_url is None:
+        new_url = link
     
     return new_url
 
+def remove_referral_http(link, session):
+    """Remove referral link by following the http redirect chain without browser.
+
+    Args:
+        link (str): Link with referral part
+        session (requests.Session): http session
+
+    Returns:
+        new_url(str): Clean link without referral part, None if the link does not redirect via http
+    """
+    try:
+        # Try cheap HEAD request first, some providers only redirect on GET
+        response = session.head(link, allow_redirects=True, timeout=HTTP_TIMEOUT)
+        if response.url == link:
+            response = session.get(link, allow_redirects=True, timeout=HTTP_TIMEOUT, stream=True)
+            response.close()
+    except Exception as e:
+        logging.debug(f'Http redirect resolution of {link} failed: {e}')
+        return None
+    
+    if response.url == link:
+        return None
+    
+    return response.url
+
+def resolve_referrals(links, driver, session=None, cache=None, max_workers=8):
+    """Resolves referral links. Cached links are taken from the cache, the remaining ones are resolved
+    in parallel via http and only the ones without http redirect are opened in the browser.
+
+    Args:
+        links (list): List of links with referral part
+        driver (webdriver): chrome driver instance
+        session (requests.Session, optional): http session
+        cache (referral_cache.ReferralCache, optional): cache with already resolved links
+        max_workers (int): Number of links resolved in parallel via http
+
+    Returns:
+        dict: Dictionary with the referral link as key and the clean link as value
+    """
+    links = list(dict.fromkeys(links))
+    
+    # Get links resolved in earlier runs
+    cached_links = cache.get_many(links) if cache is not None else {}
+    missing_links = [link for link in links if link not in cached_links]
+    logging.debug(f'Found {len(cached_links)} of {len(links)} referral links in cache')
+    
+    # Resolve remaining links via http redirects in parallel
+    new_links = {}
+    if session is not None and missing_links:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            http_urls = executor.map(lambda link: remove_referral_http(link, session), missing_links)
+            new_links = {link: url for link, url in zip(missing_links, http_urls) if url}
+    
+    # Open links without http redirect in the browser
+    for link in missing_links:
+        if link not in new_links:
+            new_url = remove_referral(link, driver)
+            new_links[link] = new_url if new_url != link else None
+    
+    if cache is not None:
+        cache.set_many(new_links)
+    
+    # Keep the original link if it could not be resolved
+    resolved_links = {**cached_links, **new_links}
+    resolved_links = {link: resolved_links[link] or link for link in links}
+    
+    return resolved_links
+
 def reduce_to_one_link(link_list, country, provider):
     """Reduces link list to one final link, removes any links not from the provider.
     If no link provided, a default link for a provider is returned.
@@ -261,46 +483,83 @@ def reduce_to_one_link(link_list, country, provider):
     
     return final_link
 
-def clean_movie_data(movie_detail_dict, driver, country, provider, from_existing=False):
-    """Cleans scraped movie data columns
+def clean_movie_data(movie_detail_dict, driver, country, provider, from_existing=False, session=None,
+                     referral_cache=None):
+    """Cleans scraped movie data columns. All columns are cleaned vectorized, link lists are exploded
+    into one link per row instead of being processed row by row.
 
     Args:
         movie_detail_dict (dict): Raw movie dictionary
+        session (requests.Session, optional): http session used to resolve the referral links
+        referral_cache (referral_cache.ReferralCache, optional): cache with already resolved referral links
 
     Returns:
         pd.DataFrame: Cleaned movie dataframe
     """
-    # Combine results from all dates
+    # Combine results from all dates into one frame
     if from_existing:
-        full_df = pd.DataFrame(movie_detail_dict.values())
+        movie_records = list(movie_detail_dict.values())
     else:
-        full_df = pd.concat([pd.DataFrame.from_dict(x) for x in movie_detail_dict.values()]).reset_index(drop=True)
+        movie_records = [movie for movies in movie_detail_dict.values() for movie in movies]
+    full_df = pd.DataFrame(movie_records)
     
     ##  Clean columns
     # Strip whitespaces from name column
     full_df['name'] = full_df['name'].str.strip()
     
     # Remove parentheses from release year column
-    full_df['release_year'] = full_df['release_year'].str.extract(r'(\d{4})').apply(pd.to_numeric, errors='coerce')
+    full_df['release_year'] = pd.to_numeric(full_df['release_year'].str.extract(r'(\d{4})', expand=False),
+                                            errors='coerce')
     
     # Remove referal part from imdb link
-    full_df['imdb_link'] = full_df['imdb_link'].str.replace(r'\/\?ref_=justwatch','', regex=True)
-    
-    # Add number of ratings column
-    full_df['num_ratings'] = full_df['imdb_rating'].str.extract(r'\((.*)\)')
+    full_df['imdb_link'] = full_df['imdb_link'].str.replace('/?ref_=justwatch', '', regex=False)
     
-    # Remove numer of ratings from rating column
-    full_df['imdb_rating'] = full_df['imdb_rating'].str.replace(r'\(.*\)', '', regex=True).apply(pd.to_numeric, errors='coerce')
+    # Split rating and number of ratings in one pass
+    full_df['imdb_rating'], full_df['num_ratings'] = normalization.split_rating_series(full_df['imdb_rating'])
     
-    # Add empty string if no links found
-    full_df['flatrate_links'] = full_df['flatrate_links'].apply(lambda x: x if x else x.append(''))
+    # One row per link, indexed by the position of the movie
+    all_links = full_df['flatrate_links'].explode().dropna()
+    all_links = all_links[all_links != '']
     
     # Remove referral part from streaming link
-    full_df = full_df.loc[~(full_df['flatrate_links'].isna())]
-    full_df['flatrate_links'] = full_df['flatrate_links'].apply(lambda x: [remove_referral(n, driver) for n in x])
+    resolved_links = resolve_referrals(all_links.tolist(), driver, session, referral_cache)
+    # Without any link the series is float, it is cast to object for the string methods below
+    all_links = all_links.map(resolved_links).astype(object)
     
-    # Reduce to one link
-    full_df ['flatrate_link'] = full_df['flatrate_links'].apply(lambda x: reduce_to_one_link(x, country, provider))
+    # Slice the exploded links back into one list per movie, movies without links keep an empty list
+    num_links = all_links.groupby(level=0).size().reindex(full_df.index, fill_value=0)
+    link_values = all_links.tolist()
+    link_offsets = [0] + num_links.cumsum().tolist()
+    full_df['flatrate_links'] = [link_values[start:end] for start, end in zip(link_offsets[:-1], link_offsets[1:])]
+    
+    # Reduce to the first link of the provider, a default link for the provider if there is none
+    provider_links = all_links[all_links.str.contains(mappings.provider_slugs[provider], regex=False)]
+    full_df['flatrate_link'] = provider_links.groupby(level=0, sort=False).first().reindex(full_df.index)
+    if full_df['flatrate_link'].isna().any():
+        full_df['flatrate_link'] = full_df['flatrate_link'].fillna(mappings.default_link_dict[country][provider])
+    
+    # Store numbers and dates typed
+    full_df = normalize_movie_types(full_df)
+    
+    return full_df
+
+def normalize_movie_types(full_df):
+    """Converts ratings, number of ratings, runtime, release year and date to numeric and date types
+
+    Args:
+        full_df (pd.DataFrame): Cleaned movie dataframe
+
+    Returns:
+        pd.DataFrame: Movie dataframe with typed columns, missing values are None
+    """
+    full_df['date_added'] = pd.to_datetime(full_df['date_added'].astype('string').str[:10], format='%Y-%m-%d')
+    full_df['release_year'] = pd.to_numeric(full_df['release_year'], errors='coerce').astype('Int64')
+    full_df['imdb_rating'] = pd.to_numeric(full_df['imdb_rating'], errors='coerce').astype('float')
+    full_df['num_ratings'] = normalization.parse_num_ratings_series(full_df['num_ratings'])
+    full_df['runtime'] = normalization.parse_runtime_series(full_df['runtime'])
+    
+    # Replace NaN by None so missing values are stored as null
+    full_df = full_df.astype(object).where(full_df.notna(), None)
     
     return full_df
 
@@ -314,31 +573,39 @@ def handle_consent_popup(driver):
         None
     """
     
-    time.sleep(5)
-    shadow = Shadow(driver)
+    # Drivers with a stored consent do not show the pop-up, no need to wait for it
+    if isinstance(driver, browser.ManagedDriver) and driver.consent_restored:
+        return
+    
+    # Wait until the accept button is rendered, no pop-up is shown if consent was already given
+    accept_all = waits.wait_until(driver, waits.consent_button_present, 'consent_popup', timeout=5)
+    if accept_all is None:
+        return
+    
     try:
-        accept_all = shadow.find_elements('button')[-1]
         accept_all.click()
     except NoSuchElementException:
-        pass
+        return
     except ElementNotInteractableException:
-        pass
+        return
+    
+    # Store the consent once the pop-up is closed, so new drivers can skip it
+    if isinstance(driver, browser.ManagedDriver):
+        closed = waits.wait_until(driver, lambda driver: not waits.consent_button_present(driver),
+                                  'consent_closed', timeout=5)
+        if closed:
+            driver.save_consent_state()
     
     return
 
 def set_up_chromedriver():
-    options = Options()
-    options.add_argument('--headless')  
+    """Starts a chromedriver that is restarted after a number of pages, see browser.ManagedDriver"""
+    return browser.ManagedDriver()
 
-    # Set-Up global Chromedriver
-    chromedriver_path = os.environ.get('full_path') + '/crawler/chromedriver'
-    driver = webdriver.Chrome(chromedriver_path, options=options)
+def iter_current_releases(countries, providers, days_backwards=1, num_workers=1, use_http=False, skip_units=(),
+                          known_movies=None):
     
-    return driver
-
-def scrape_current_releases(countries, providers, days_backwards=1):
-    
-    """ Scrapes the current releases of all countries and providers
+    """ Scrapes the current releases of all countries and providers, yields the movies after each provider
 
     Args:
         countries (list): List of countries that releases should be scraped for. The corresponding
@@ -346,167 +613,305 @@ def scrape_current_releases(countries, providers, days_backwards=1):
         providers (list): List of providers that releases should be scraped for. The corresponding 
         streaming links need to be specified in the mappings file.
         days_backwards (int): Number of days in the past to consider
-    
-    Returns:
-        list: List of dictionaries containing the scraped movies
+        num_workers (int): Number of chromedrivers used to scrape the detail pages concurrently
+        use_http (bool): Fetch the detail pages via http and only fall back to the chromedriver if needed
+        skip_units (iterable): (country, provider) tuples that are already scraped and should be skipped
+        known_movies (set, optional): Set of already stored (link, provider, country, date) tuples that are not
+        scraped again
+    
+    Yields:
+        tuple: country, provider and list of dictionaries containing the scraped movies
     """
     
-    driver = set_up_chromedriver()
-        
-    # Loop over all countries and providers
-    country_provider_movies = []
-    for country in countries:
-        logging.debug (f'Scraping {country}...')
-        
-        for provider in providers:
-            logging.debug (f'Scraping {provider}...')
-            
-            # Get url from mapping file
-            url = mappings.country_provider_dict[country][provider]
+    # Http session for referral links (and detail pages if requested) and cache for resolved referral links
+    session = set_up_http_session()
+    detail_session = session if use_http else None
+    resolved_referral_cache = referral_cache.ReferralCache()
     
-            # Open url with Chromedriver
-            driver.get(url)
-            
-            # Handle consent cookies, click on accept all button
-            handle_consent_popup(driver)
-            
-            # Get movie links from yesterday and today
-            movie_link_dict = get_timeline_links(driver, days_backwards=days_backwards)
+    # Main driver and worker pool for the detail pages if requested, quit in any case once the crawl ends
+    drivers = browser.DriverPool(num_workers)
+    
+    # Loop over all countries and providers
+    try:
+        driver, worker_drivers = drivers.start().driver, drivers.workers
+        for country in countries:
+            logging.debug (f'Scraping {country}...')
             
-            # Check if any movies were found
-            if len(movie_link_dict) > 0:
-                 
-                # Extract movie details
-                movie_detail_dict = extract_movie_details(movie_link_dict, driver)
-                
-                # Clean movie details
-                clean_movie_df = clean_movie_data(movie_detail_dict, driver, country, provider)
+            for provider in providers:
+                if (country, provider) in skip_units:
+                    logging.debug (f'Skipping {provider}, already scraped...')
+                    continue
+                logging.debug (f'Scraping {provider}...')
                 
-                # Convert df to dict
-                clean_movie_list = clean_movie_df.to_dict('records')
-
-                # Add meta data about provider and country and append to list
-                for movie in clean_movie_list:
-                    movie['meta_provider'] = provider
-                    movie['meta_country'] = country
-                    country_provider_movies.append(movie)
+                # Get url from mapping file
+                url = mappings.country_provider_dict[country][provider]
         
-    return country_provider_movies
+                # Open url with Chromedriver
+                driver.get(url)
+                
+                # Handle consent cookies, click on accept all button
+                handle_consent_popup(driver)
+                
+                # Get movie links from yesterday and today
+                movie_link_dict = get_timeline_links(driver, days_backwards=days_backwards)
+                
+                # Only keep movies that are not stored yet
+                if known_movies is not None:
+                    movie_link_dict = remove_known_links(movie_link_dict, known_movies, country, provider)
+                
+                # Check if any movies were found
+                clean_movie_list = []
+                if len(movie_link_dict) > 0:
+                     
+                    # Extract movie details
+                    if worker_drivers:
+                        movie_detail_dict = extract_movie_details_with_pool(movie_link_dict, worker_drivers,
+                                                                            detail_session)
+                    else:
+                        movie_detail_dict = extract_movie_details(movie_link_dict, driver, detail_session)
+                    
+                    # Clean movie details
+                    clean_movie_df = clean_movie_data(movie_detail_dict, driver, country, provider,
+                                                      session=session, referral_cache=resolved_referral_cache)
+                    
+                    # Convert df to dict
+                    clean_movie_list = clean_movie_df.to_dict('records')
 
-def scroll_down_page(driver, movies=500):
-    """Scroll down page until n movies are found
+                    # Add meta data about provider and country
+                    for movie in clean_movie_list:
+                        movie['meta_provider'] = provider
+                        movie['meta_country'] = country
+                
+                yield country, provider, clean_movie_list
+    finally:
+        drivers.quit()
+        session.close()
+        resolved_referral_cache.close()
+        waits.log_wait_summary()
 
-    Args:
-        driver (_type_): _description_
+def scrape_current_releases(countries, providers, days_backwards=1, num_workers=1, use_http=False,
+                            known_movies=None):
+    
+    """ Scrapes the current releases of all countries and providers
 
+    Args:
+        countries (list): List of countries that releases should be scraped for. The corresponding
+        streaming provider links need to be specified in the mappings file.
+        providers (list): List of providers that releases should be scraped for. The corresponding 
+        streaming links need to be specified in the mappings file.
+        days_backwards (int): Number of days in the past to consider
+        num_workers (int): Number of chromedrivers used to scrape the detail pages concurrently
+        use_http (bool): Fetch the detail pages via http and only fall back to the chromedriver if needed
+        known_movies (set, optional): Set of already stored (link, provider, country, date) tuples that are not
+        scraped again
+    
     Returns:
-        _type_: _description_
+        list: List of dictionaries containing the scraped movies
     """
     
-    SCROLL_PAUSE_TIME = 0.5
+    country_provider_movies = []
+    for country, provider, clean_movie_list in iter_current_releases(countries, providers, days_backwards,
+                                                                     num_workers, use_http,
+                                                                     known_movies=known_movies):
+        country_provider_movies += clean_movie_list
+        
+    return country_provider_movies
 
-    # Get HTML page
-    html = driver.page_source
-    soup = BeautifulSoup(html, features="html.parser")
-    
-    # Get all movies currently shown:
-    num_movies_shown = len(soup.findAll('div', class_='title-list-grid__item'))
-    tries = 0
-    
-    while num_movies_shown < movies and tries < 50:
-        # Scroll down to bottom
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+class GridSampler:
+    """Samples movie links from the infinite-scroll grid of the top movies without replacement.
+    Only the links of newly loaded items are read, the page is scrolled only once all loaded links are sampled.
+    """
 
-        # Wait to load page
-        time.sleep(SCROLL_PAUSE_TIME)
-        
-        # Get HTML page
-        html = driver.page_source
-        soup = BeautifulSoup(html, features="html.parser")
-        
-        # Get all movies currently shown:
-        num_movies_shown = len(soup.findAll('div', class_='title-list-grid__item'))
-        logging.debug(f"Try {tries+1}, found {num_movies_shown} movies...")
-        tries += 1
-    
-    return driver
+    def __init__(self, driver, max_items=500, skip_links=(), max_scrolls=50, timeout=5, rng=None):
+        """
+        Args:
+            driver (obj): chromedriver with the grid page opened
+            max_items (int): Maximum number of grid items that are loaded
+            skip_links (set): Movie links that are not sampled, e.g. already stored ones
+            max_scrolls (int): Maximum number of scrolls
+            timeout (int): Seconds to wait for new items after scrolling
+            rng (random.Random, optional): Random number generator, e.g. seeded for reproducible samples
+        """
+        self.driver = driver
+        self.max_items = max_items
+        self.skip_links = skip_links
+        self.max_scrolls = max_scrolls
+        self.timeout = timeout
+        self.rng = rng or random.Random()
+        self.num_items_seen = 0
+        self.num_scrolls = 0
+        self.num_skipped = 0
+        self.seen_links = set()
+        self.candidates = []
+        self.exhausted = False
+
+    def load_more(self):
+        """Scrolls down (except for the items shown initially) and adds the links of the new items to the candidates
+
+        Returns:
+            bool: False if no more items can be loaded
+        """
+        if self.exhausted or self.num_items_seen >= self.max_items or self.num_scrolls >= self.max_scrolls:
+            self.exhausted = True
+            return False
+
+        # Scroll down to bottom, except for the first read, where the grid may not be rendered yet
+        # (pages are loaded eagerly). Wait until more movies are loaded, stop if no new movies appear.
+        if self.num_items_seen:
+            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            self.num_scrolls += 1
+        num_items_shown = waits.wait_until(self.driver,
+                                           waits.element_count_greater_than(GRID_ITEM_SELECTOR, self.num_items_seen),
+                                           'grid_scroll' if self.num_items_seen else 'grid_load', timeout=self.timeout)
+        if num_items_shown is None:
+            logging.debug(f"Scroll {self.num_scrolls}, no new movies loaded, stop scrolling...")
+            self.exhausted = True
+            return False
+
+        # Only read the items loaded since the last call, reads without new items count as scrolls
+        hrefs = self.driver.execute_script(GRID_ITEMS_SCRIPT, GRID_ITEM_SELECTOR, self.num_items_seen)
+        hrefs = hrefs[:self.max_items - self.num_items_seen]
+        if not hrefs and not self.num_items_seen:
+            self.num_scrolls += 1
+        self.num_items_seen += len(hrefs)
+        for href in hrefs:
+            link = 'https://www.justwatch.com' + href if href else None
+            if link is None or link in self.seen_links:
+                continue
+            self.seen_links.add(link)
+            if link in self.skip_links:
+                self.num_skipped += 1
+            else:
+                self.candidates.append(link)
+        logging.debug(f"Scroll {self.num_scrolls}, found {self.num_items_seen} movies, "
+                      f"{len(self.candidates)} candidates...")
+
+        return True
+
+    def sample(self, n):
+        """Draws up to n links that were not drawn before, loads more items only if too few candidates are left
+
+        Returns:
+            list: Sampled movie links, empty if the grid is exhausted
+        """
+        while len(self.candidates) < n and self.load_more():
+            pass
+
+        sampled_links = self.rng.sample(self.candidates, min(n, len(self.candidates)))
+        sampled = set(sampled_links)
+        self.candidates = [link for link in self.candidates if link not in sampled]
+
+        return sampled_links
 
 def filter_by_number_ratings(movie_dict, min_ratings=10000):
     for key in movie_dict.keys():
         # Extract number of ratings from imdb rating & convert to int
-        movie_dict[key]['num_ratings'] = re.findall(r'\((.*)\)', movie_dict[key]['imdb_rating'])
-        if movie_dict[key]['num_ratings']:
-            movie_dict[key]['num_ratings'] = movie_dict[key]['num_ratings'][0]
-            movie_dict[key]['num_ratings_int'] = int(movie_dict[key]['num_ratings'].replace('k', '000').replace('m','000000'))
-        else:
-            movie_dict[key]['num_ratings_int'] = 0
+        num_ratings = re.findall(r'\((.*)\)', movie_dict[key]['imdb_rating'])
+        movie_dict[key]['num_ratings_int'] = (normalization.parse_num_ratings(num_ratings[0]) or 0) if num_ratings else 0
             
     # Only keep movies with at least 10k reviews
     filtered_dict = {k:v for (k,v) in movie_dict.items() if v['num_ratings_int'] > min_ratings}
     
     return filtered_dict
 
-def get_best_movie_details(driver, num_movies, country, provider):
-    import numpy as np
-    
-    best_movies = []
-    # Scroll down page until 500 movies are shown
-    scroll_down_page(driver, num_movies)
-    
-    # Get HTML page
-    html = driver.page_source
-    soup = BeautifulSoup(html, features="html.parser")
-    movies = soup.findAll('div', class_='title-list-grid__item')
+def get_best_movie_details(driver, num_movies, country, provider, worker_drivers=None, session=None,
+                           referral_session=None, resolved_referral_cache=None, known_links=None,
+                           num_best_movies=3, min_ratings=10000):
+    """Randomly selects movies from the top movies grid until enough movies with enough ratings are found.
+    Movies are sampled while the grid is loaded, so scrolling stops as soon as enough movies are found.
+
+    Args:
+        driver (obj): chromedriver with the top movies page opened
+        num_movies (int): Maximum number of grid items that are loaded
+        country (str): Country of the page
+        provider (str): Provider of the page
+        worker_drivers (list, optional): Drivers of the worker pool for the detail pages
+        session (requests.Session, optional): Session to fetch the detail pages via http
+        referral_session (requests.Session, optional): Session to resolve the referral links
+        resolved_referral_cache (ReferralCache, optional): Cache of resolved referral links
+        known_links (set, optional): Set of already stored (link, provider, country) tuples, these are skipped
+        num_best_movies (int): Number of movies to find
+        min_ratings (int): Minimum number of imdb ratings
+
+    Returns:
+        pd.DataFrame: Cleaned movie details, fewer movies if the grid does not contain enough
+    """
+    # Movies that are already stored are not selected again
+    skip_links = {link for link, known_provider, known_country in known_links or ()
+                  if known_provider == provider and known_country == country}
+    sampler = GridSampler(driver, num_movies, skip_links)
     
     movie_detail_dict = {}
-    # Ensure that 3 proper movies are selected (movies with too few ratings are bing discarded)
-    while len(movie_detail_dict) < 3:
-        # Randomly select 3 movies to scrape
-        random_nums = [np.random.randint(0,len(movies)) for i in range(3)]
-        selected_movies = [movies[i] for i in random_nums]
-        
-        # Extract movie links
-        movie_links = ['https://www.justwatch.com' + movie.find("a", recursive=False)['href'] for movie in selected_movies]
+    date = datetime.date.today().strftime("%Y-%m-%d")
+    # Ensure that enough proper movies are selected (movies with too few ratings are bing discarded)
+    while len(movie_detail_dict) < num_best_movies:
+        # Randomly select the missing number of movies, at least one per worker
+        num_missing = num_best_movies - len(movie_detail_dict)
+        movie_links = sampler.sample(max(num_missing, len(worker_drivers or [])))
+        if not movie_links:
+            logging.debug(f'Only found {len(movie_detail_dict)} movies with enough ratings...')
+            break
 
         # Get movie details from movie page
-        date = datetime.date.today().strftime("%Y-%m-%d")
-        for link in movie_links:
-            movie_details = extract_movie_details_from_link(link, driver, date)
-            movie_detail_dict[link] = movie_details
+        if worker_drivers:
+            movie_details = extract_movie_details_with_pool({date: movie_links}, worker_drivers, session)[date]
+            movie_detail_dict.update(zip(movie_links, movie_details))
+        else:
+            for link in movie_links:
+                movie_details = fetch_movie_details(link, driver, date, session)
+                movie_detail_dict[link] = movie_details
         
         # Filter out any movies with less than 10.000 ratings
-        movie_detail_dict = filter_by_number_ratings(movie_detail_dict, min_ratings=10000)
+        movie_detail_dict = filter_by_number_ratings(movie_detail_dict, min_ratings=min_ratings)
+    
+    logging.debug(f'Loaded {sampler.num_items_seen} of {num_movies} movies with {sampler.num_scrolls} scrolls, '
+                  f'skipped {sampler.num_skipped} stored movies...')
+    if not movie_detail_dict:
+        return pd.DataFrame()
         
     # Clean movie detail columns
-    best_movie_df = clean_movie_data(movie_detail_dict, driver, country, provider,True)
+    best_movie_df = clean_movie_data(movie_detail_dict, driver, country, provider,True,
+                                     session=referral_session, referral_cache=resolved_referral_cache)
 
     return best_movie_df
 
-def scrape_top_releases(countries, providers):
+def scrape_top_releases(countries, providers, num_workers=1, use_http=False, known_links=None):
     
-    # Intantiate chromedriver
-    driver = set_up_chromedriver()
+    # Http session for referral links (and detail pages if requested) and cache for resolved referral links
+    session = set_up_http_session()
+    detail_session = session if use_http else None
+    resolved_referral_cache = referral_cache.ReferralCache()
+    
+    # Main driver and worker pool for the detail pages if requested, quit in any case once the crawl ends
+    drivers = browser.DriverPool(num_workers)
 
     combined_best_movie_df = pd.DataFrame()
-    for country in countries:
-        
-        for provider in providers:
-            logging.debug (f'Scraping top releases from {provider} in {country}...')
-            
-            # Get url from mapping file
-            url = mappings.country_provider_topmovies_dict[country][provider]
-    
-            # Open url with Chromedriver
-            driver.get(url)
-            
-            # Handle consent cookies, click on accept all button
-            handle_consent_popup(driver)
+    try:
+        driver, worker_drivers = drivers.start().driver, drivers.workers
+        for country in countries:
             
-            # Scrape best movies
-            best_movie_df =  get_best_movie_details(driver, 500, country, provider)
-            best_movie_df['meta_provider'] = provider
-            best_movie_df['meta_country'] = country
-            combined_best_movie_df = pd.concat([combined_best_movie_df, best_movie_df])          
+            for provider in providers:
+                logging.debug (f'Scraping top releases from {provider} in {country}...')
+                
+                # Get url from mapping file
+                url = mappings.country_provider_topmovies_dict[country][provider]
+        
+                # Open url with Chromedriver
+                driver.get(url)
+                
+                # Handle consent cookies, click on accept all button
+                handle_consent_popup(driver)
+                
+                # Scrape best movies
+                best_movie_df =  get_best_movie_details(driver, 500, country, provider, worker_drivers, detail_session,
+                                                        session, resolved_referral_cache, known_links)
+                best_movie_df['meta_provider'] = provider
+                best_movie_df['meta_country'] = country
+                combined_best_movie_df = pd.concat([combined_best_movie_df, best_movie_df])          
+    finally:
+        drivers.quit()
+        session.close()
+        resolved_referral_cache.close()
+        waits.log_wait_summary()
             
     return combined_best_movie_df
-
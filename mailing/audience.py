@@ -0,0 +1,204 @@
+import collections
+import datetime
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+import mailchimp_marketing as MailchimpMarketing
+from mailing import templating
+
+# Maximum page size of the Mailchimp API
+PAGE_SIZE = 1000
+MEMBER_FIELDS = ['members.email_address', 'members.status', 'members.last_changed', 'members.merge_fields',
+                 'total_items']
+
+# Merge fields of the audience that hold the newsletter preferences of a subscriber
+PREFERENCE_MERGE_FIELDS = {'providers': 'PROVIDERS', 'country': 'COUNTRY', 'min_rating': 'MINRATING'}
+
+# Newsletter preferences, subscribers with equal preferences get the same newsletter
+Preferences = collections.namedtuple('Preferences', ['providers', 'country', 'min_rating'])
+DEFAULT_PREFERENCES = Preferences(providers=tuple(templating.PROVIDERS), country=None, min_rating=0.0)
+
+
+def create_client():
+    api_key = environ.get('mailchimp_api_key')
+
+    # Connect to client
+    client = MailchimpMarketing.Client()
+    client.set_config({"api_key": api_key,"server": "us21"})
+
+    return client
+
+def get_default_snapshot_path():
+    return os.environ.get('full_path') + '/mailing/audience_snapshot.json'
+
+def fetch_list_ids(client):
+    """Gets the ids of all audience lists, page by page"""
+    list_ids = []
+    offset = 0
+    while True:
+        response = client.lists.get_all_lists(count=PAGE_SIZE, offset=offset, fields=['lists.id', 'total_items'])
+        list_ids += [audience_list['id'] for audience_list in response['lists']]
+        offset += PAGE_SIZE
+        if not response['lists'] or offset >= response['total_items']:
+            break
+
+    return list_ids
+
+def fetch_list_members(client, list_id, since_last_changed=None):
+    """Gets all members of a list, page by page
+
+    Args:
+        client (MailchimpMarketing.Client): Mailchimp client
+        list_id (str): Id of the list
+        since_last_changed (str, optional): Only get members changed after this time (ISO 8601), including
+        unsubscribed ones. Without it, only subscribed members are fetched.
+
+    Returns:
+        list: List of member dicts
+    """
+    query = {'count': PAGE_SIZE, 'fields': MEMBER_FIELDS}
+    if since_last_changed:
+        query['since_last_changed'] = since_last_changed
+    else:
+        query['status'] = 'subscribed'
+
+    members = []
+    offset = 0
+    while True:
+        response = client.lists.get_list_members_info(list_id, offset=offset, **query)
+        members += response['members']
+        offset += PAGE_SIZE
+        if not response['members'] or offset >= response['total_items']:
+            break
+
+    return members
+
+def get_preferences(member):
+    """Reads the newsletter preferences from the merge fields of a member.
+    Missing or invalid values fall back to the defaults, providers are kept in the order of the newsletter.
+
+    Args:
+        member (dict): Member with merge_fields
+
+    Returns:
+        Preferences: Providers, country (None for all countries) and minimum imdb rating
+    """
+    merge_fields = member.get('merge_fields') or {}
+
+    # Providers as comma separated list, e.g. 'Netflix, Amazon Prime Video'
+    selected_providers = {provider.strip().lower()
+                          for provider in str(merge_fields.get(PREFERENCE_MERGE_FIELDS['providers']) or '').split(',')}
+    providers = tuple(provider for provider in templating.PROVIDERS if provider.lower() in selected_providers)
+
+    country = str(merge_fields.get(PREFERENCE_MERGE_FIELDS['country']) or '').strip()
+
+    try:
+        min_rating = float(merge_fields.get(PREFERENCE_MERGE_FIELDS['min_rating']) or 0)
+    except ValueError:
+        min_rating = DEFAULT_PREFERENCES.min_rating
+
+    return Preferences(providers=providers or DEFAULT_PREFERENCES.providers,
+                       country=country or DEFAULT_PREFERENCES.country,
+                       min_rating=min_rating)
+
+def group_by_preferences(members):
+    """Groups the mail addresses of members by their preferences
+
+    Returns:
+        dict: Dictionary with the Preferences as key and the list of mail addresses as value
+    """
+    groups = collections.defaultdict(list)
+    for member in members:
+        groups[get_preferences(member)].append(member['email_address'])
+
+    return dict(groups)
+
+class AudienceFetcher:
+    """Fetches the subscribed members of all lists concurrently and keeps a local snapshot.
+    Lists already in the snapshot are updated incrementally with the members changed since the last sync.
+    """
+
+    def __init__(self, client=None, snapshot_path=None, max_workers=4):
+        """
+        Args:
+            client (optional): Mailchimp client, e.g. a stub with the same lists interface for tests
+            snapshot_path (str, optional): Path of the snapshot file, None to use the default path
+            max_workers (int): Number of lists fetched at the same time
+        """
+        self.client = client or create_client()
+        self.snapshot_path = snapshot_path or get_default_snapshot_path()
+        self.max_workers = max_workers
+
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return {'lists': {}}
+        with open(self.snapshot_path, 'r') as f:
+            return json.load(f)
+
+    def save_snapshot(self, snapshot):
+        # Write to a temporary file first, so an interrupted run does not corrupt the snapshot
+        temporary_path = self.snapshot_path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temporary_path, self.snapshot_path)
+
+        return
+
+    def _sync_list(self, list_id, list_snapshot):
+        """Updates the snapshot of one list, returns the updated list snapshot"""
+        sync_time = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        if list_snapshot is None:
+            list_snapshot = {'last_sync': None, 'members': {}}
+
+        changed_members = fetch_list_members(self.client, list_id, list_snapshot['last_sync'])
+        for member in changed_members:
+            list_snapshot['members'][member['email_address'].lower()] = {
+                'email_address': member['email_address'],
+                'status': member['status'],
+                'merge_fields': member.get('merge_fields', {}),
+            }
+        list_snapshot['last_sync'] = sync_time
+        logging.debug(f'Fetched {len(changed_members)} changed members of list {list_id}')
+
+        return list_snapshot
+
+    def sync(self, list_id=''):
+        """Updates the snapshot of one list or of all lists
+
+        Returns:
+            dict: Snapshot with the list id as key
+        """
+        snapshot = self.load_snapshot()
+        list_ids = [list_id] if list_id else fetch_list_ids(self.client)
+
+        # Drop lists that do not exist anymore
+        if not list_id:
+            snapshot['lists'] = {i: list_snapshot for i, list_snapshot in snapshot['lists'].items() if i in list_ids}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list_snapshots = executor.map(lambda i: self._sync_list(i, snapshot['lists'].get(i)), list_ids)
+            for i, list_snapshot in zip(list_ids, list_snapshots):
+                snapshot['lists'][i] = list_snapshot
+
+        self.save_snapshot(snapshot)
+
+        return snapshot
+
+    def get_subscribed_members(self, list_id=''):
+        """Gets the subscribed members, deduplicated across lists by mail address
+
+        Returns:
+            list: List of member dicts with email_address, status and merge_fields
+        """
+        snapshot = self.sync(list_id)
+        list_ids = [list_id] if list_id else list(snapshot['lists'])
+
+        members = {}
+        for i in list_ids:
+            for address, member in snapshot['lists'][i]['members'].items():
+                if member['status'] == 'subscribed' and address not in members:
+                    members[address] = member
+
+        return list(members.values())
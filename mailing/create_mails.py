@@ -1,74 +1,82 @@
 import sys
 import os
 sys.path.append(os.environ.get('full_path'))
-import pandas as pd
+import collections
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor
 from DB import crud
-from bs4 import BeautifulSoup
+from crawler.db import connect_to_movie_collection
+from crawler import normalization
+from mailing import templating, audience
 from dotenv import load_dotenv
 load_dotenv()
 
-def connect_to_movie_collection():
-    # Connect to MovieReleases mongoDB
-    uri = os.environ.get('database_uri')
-    cert_path = os.environ.get('database_cert_path')
-    client = MongoClient(uri,
-                        tls=True,
-                        tlsCertificateKeyFile=cert_path)
-    
-    db = client['movieReleases']
-    collection = db['movies']
-    
-    return collection
+# Rendered newsletter and the ids of the movies added from the providers' libraries
+Newsletter = collections.namedtuple('Newsletter', ['html', 'library_movie_ids'])
 
-def get_all_entries(collection):
-    
-    # Get all entries from MongoDB
-    all_entries = collection.find()
-    all_entry_df = pd.DataFrame(list(all_entries))
-    
-    return all_entry_df
+def build_top_movies_pipeline(since_date, n_movies=3, min_ratings=10000, country=None, min_imdb_rating=0):
+    """Builds the aggregation pipeline for the top rated movies per provider
+
+    Args:
+        since_date (datetime): Only movies added after this date are considered
+        n_movies (int): Number of movies per provider
+        min_ratings (int): Minimum number of imdb ratings
+        country (str, optional): Only movies of this country, all countries if None
+        min_imdb_rating (float): Minimum imdb rating
 
-def get_top_movies_by_provider(n_movies=3):
+    Returns:
+        list: MongoDB aggregation pipeline
+    """
+    match = {
+        'date_added': {'$gt': since_date},
+        'imdb_rating': {'$gte': min_imdb_rating},
+        'num_ratings': {'$gte': min_ratings},
+    }
+    if country is not None:
+        match['meta_country'] = country
+
+    pipeline = [
+        # Filter for last week, only keep movies with imdb score and at least 10k reviews
+        {'$match': match},
+        # Sort movies by rating and keep top n per streaming service
+        {'$sort': {'imdb_rating': -1}},
+        {'$group': {
+            '_id': '$meta_provider',
+            'best_rating': {'$first': '$imdb_rating'},
+            'movies': {'$push': {
+                'name': '$name',
+                'release_year': '$release_year',
+                'runtime': '$runtime',
+                'imdb_rating': '$imdb_rating',
+                'flatrate_links': '$flatrate_links',
+                'flatrate_link': '$flatrate_link',
+            }},
+        }},
+        {'$sort': {'best_rating': -1}},
+        {'$project': {'movies': {'$slice': ['$movies', n_movies]}}},
+    ]
+    
+    return pipeline
+
+def get_top_movies_by_provider(n_movies=3, country=None, min_imdb_rating=0):
     
-    # Read in all movie releases from MongoDB
+    # Get the top movies of the last week per provider, aggregated by MongoDB
     movie_collection = connect_to_movie_collection()
-    movie_df = get_all_entries(movie_collection)
-    movie_df['date_added'] = pd.to_datetime(movie_df['date_added'])
-    
-    # Filter for last week
-    today = datetime.today()
-    one_week_ago = today - timedelta(days=7)
-    last_week_movie_df = movie_df[movie_df['date_added'] >= one_week_ago]
+    one_week_ago = datetime.combine((datetime.today() - timedelta(days=7)).date(), datetime.min.time())
+    pipeline = build_top_movies_pipeline(one_week_ago, n_movies=n_movies, country=country,
+                                         min_imdb_rating=min_imdb_rating)
     
-    # Filter out movies without imdb score or reviews
-    last_week_movie_df = last_week_movie_df.dropna(subset=['imdb_rating', 'num_ratings'])
-    
-    # Only keep movies with at least 10k reviews
-    last_week_movie_df['num_ratings'] = last_week_movie_df['num_ratings'].str.replace('k', '000').str.replace('m','000000').astype(int)
-    last_week_movie_df = last_week_movie_df[last_week_movie_df['num_ratings'] >= 10000]
-    
-    # Store release year as int
-    last_week_movie_df['release_year'] = last_week_movie_df['release_year'].astype(int, errors='ignore')
-    
-    # Sort movies by rating and split by streaming service
-    sorted_movies = last_week_movie_df.sort_values(by=['imdb_rating'], ascending=False)
-    top_movies_by_service = sorted_movies.groupby('meta_provider').head(n_movies).reset_index()
-    
-    # Split df by streaming service and convert to dict
+    # Convert to dict with the streaming service as key
     top_movie_dict = {}
-    for service in top_movies_by_service['meta_provider'].unique():
-        provider_df = top_movies_by_service[top_movies_by_service['meta_provider'] == service]
-        provider_df = provider_df[['name', 'release_year', 'runtime', 'imdb_rating', 'flatrate_links', 'flatrate_link']]
-        top_movie_dict[service] = provider_df.to_dict('records')
+    for provider_movies in movie_collection.aggregate(pipeline):
+        top_movie_dict[provider_movies['_id']] = provider_movies['movies']
     
     return top_movie_dict
 
 def insert_mail_content(soup, movie_dict):
     
     # Only keep netflix and amazon
-    movie_dict = {k:v for (k,v) in movie_dict.items() if k in ['Amazon Prime Video', 'Netflix']}
+    movie_dict = {k:v for (k,v) in movie_dict.items() if k in templating.PROVIDERS}
         
     provider_list = movie_dict.keys()
     
@@ -108,7 +116,7 @@ def insert_mail_content(soup, movie_dict):
             
             # Add runtime
             runtime = soup.new_tag('td')
-            runtime.string = str(movie_dict[provider][top_n]['runtime'])
+            runtime.string = normalization.format_runtime(movie_dict[provider][top_n]['runtime'])
             
             # Add link
             link = soup.new_tag('td')
@@ -126,52 +134,110 @@ def insert_mail_content(soup, movie_dict):
     
     return soup
 
-def fill_with_best_movies(movie_dict, provider, num_missing):
+def fill_with_best_movies(movie_dict, provider, num_missing, country=None, min_rating=None):
     
     # Get top movies, sort for latest ones from provider that have not been sent yet
-    top_movies = crud.get_all_movies()
-    top_movies['date_added'] = pd.to_datetime(top_movies['date_added'])
-    top_movies_filtered = top_movies.loc[(top_movies['sent']==False) & (top_movies['meta_provider']==provider)]
-    top_movies_filtered = top_movies_filtered.sort_values(by=['date_added']).iloc[:num_missing,]
+    top_movies_filtered = crud.get_unsent_movies(provider, num_missing, country=country, min_rating=min_rating)
     top_movies_filtered['top_movie'] = True
     
     # Convert to list of dicts
-    top_movies_filtered = top_movies_filtered[['name', 'release_year', 'runtime', 'imdb_rating', 'flatrate_link', 'top_movie']]
+    top_movies_filtered = top_movies_filtered[['id', 'name', 'release_year', 'runtime', 'imdb_rating', 'flatrate_link', 'top_movie']]
     top_movie_list = top_movies_filtered.to_dict('records')
     movie_dict[provider] += top_movie_list
     
     # Sort movie dict by imdb rating
-    movie_dict[provider] = sorted(movie_dict[provider], key=lambda d: float(d['imdb_rating']), reverse=True) 
+    movie_dict[provider] = sorted(movie_dict[provider], key=lambda d: d['imdb_rating'], reverse=True) 
     
     return movie_dict
 
-def update_newsletter_template(template):
-    """ Run template updating pipeline
+def get_newsletter_movies(n_movies=3, country=None, min_rating=0):
+    """Gets the top movies of the last week for all providers of the newsletter,
+    filled up with unsent movies from the provider's library
 
     Args:
-        template (str): Template html
+        n_movies (int): Number of movies per provider
+        country (str, optional): Only movies of this country, all countries if None
+        min_rating (float): Minimum imdb rating
 
     Returns:
-        updated_template(str): Template with inserted new movies
+        dict: Dictionary with the provider as key and the list of movies as value
     """
     # Get recent top movies
-    n_movies = 3
-    top_movie_dict = get_top_movies_by_provider(n_movies=n_movies)
+    top_movie_dict = get_top_movies_by_provider(n_movies=n_movies, country=country, min_imdb_rating=min_rating)
     
     # Check if each provider got 3 movies, else fill with best movies
-    providers_used = ['Amazon Prime Video', 'Netflix']
-    for provider in providers_used:
+    for provider in templating.PROVIDERS:
         if not provider in top_movie_dict.keys():
             top_movie_dict[provider] = []
-            top_movie_dict = fill_with_best_movies(top_movie_dict, provider, n_movies)
         if len(top_movie_dict[provider]) < n_movies:
             num_missing_movies = n_movies - len(top_movie_dict[provider])
-            top_movie_dict = fill_with_best_movies(top_movie_dict, provider, num_missing_movies)
+            top_movie_dict = fill_with_best_movies(top_movie_dict, provider, num_missing_movies, country, min_rating)
     
-    # Update email template with recent top movies
-    soup = BeautifulSoup(template,features="html.parser")
-    new_soup = insert_mail_content(soup, top_movie_dict)
-    updated_template = new_soup.prettify(formatter='html')
+    return top_movie_dict
+
+def render_newsletter_variants(template, preferences_list, n_movies=3, max_workers=4):
+    """Renders one newsletter per distinct preferences, independent of the number of subscribers.
+    Movies are queried once per country and minimum rating, the template is compiled once per combination of
+    providers, and the variants are queried and rendered in parallel.
+
+    Args:
+        template (str): Template html
+        preferences_list (list): Preferences of the subscribers, duplicates are rendered once
+        n_movies (int): Number of movies per provider
+        max_workers (int): Number of variants queried and rendered at the same time
+
+    Returns:
+        dict: Dictionary with the Preferences as key and the Newsletter as value
+    """
+    distinct_preferences = list(dict.fromkeys(preferences_list))
+    movie_filters = list(dict.fromkeys((preferences.country, preferences.min_rating)
+                                       for preferences in distinct_preferences))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Query the movies of every distinct filter once
+        movie_dicts = dict(zip(movie_filters, executor.map(
+            lambda movie_filter: get_newsletter_movies(n_movies, *movie_filter), movie_filters)))
+
+        # Render every variant with only the tables of its providers
+        def render_variant(preferences):
+            movie_dict = movie_dicts[(preferences.country, preferences.min_rating)]
+            movie_dict = {provider: movie_dict[provider] for provider in preferences.providers}
+            library_movie_ids = sorted({int(movie['id']) for movies in movie_dict.values() for movie in movies
+                                        if movie.get('top_movie')})
+            return Newsletter(templating.compile_template(template, preferences.providers).render(movie_dict),
+                              library_movie_ids)
+
+        newsletters = dict(zip(distinct_preferences, executor.map(render_variant, distinct_preferences)))
     
-    return updated_template
+    return newsletters
+
+def mark_library_movies_as_sent(newsletters):
+    """Marks the movies added from the providers' libraries as sent, so they are not used again.
+    Called once the newsletters were delivered, a rerun before sends the same movies.
 
+    Args:
+        newsletters (list): List of delivered Newsletters
+    """
+    library_movie_ids = {movie_id for newsletter in newsletters for movie_id in newsletter.library_movie_ids}
+    if library_movie_ids:
+        crud.mark_movies_as_sent(sorted(library_movie_ids))
+    
+    return
+
+def update_newsletter_template(template, mark_as_sent=False, preferences=None):
+    """ Run template updating pipeline
+
+    Args:
+        template (str): Template html
+        mark_as_sent (bool): Mark the movies added from the provider's library as sent
+        preferences (audience.Preferences, optional): Newsletter preferences, the default newsletter if None
+
+    Returns:
+        updated_template(str): Template with inserted new movies
+    """
+    preferences = preferences or audience.DEFAULT_PREFERENCES
+    newsletter = render_newsletter_variants(template, [preferences])[preferences]
+    if mark_as_sent:
+        mark_library_movies_as_sent([newsletter])
+    
+    return newsletter.html
@@ -0,0 +1,199 @@
+import asyncio
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+import os
+from mailing import send_mails
+
+
+def get_default_ledger_path():
+    return os.environ.get('full_path') + '/mailing/delivery_ledger.db'
+
+def get_campaign_id(date=None):
+    """Campaign id of the weekly newsletter, e.g. '2023-W27'"""
+    year, week, _ = (date or datetime.date.today()).isocalendar()
+    return f'{year}-W{week:02d}'
+
+class DeliveryLedger:
+    """Persistent record of the addresses a campaign was delivered to and of the newsletters rendered for it,
+    so a rerun skips the delivered addresses and sends the same newsletters to the others
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_default_ledger_path()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS deliveries ('
+            'campaign TEXT NOT NULL, '
+            'address TEXT NOT NULL, '
+            'status TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL, '
+            'error TEXT, '
+            'updated_at REAL NOT NULL, '
+            'PRIMARY KEY (campaign, address))')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS newsletters ('
+            'campaign TEXT NOT NULL, '
+            'preferences TEXT NOT NULL, '
+            'html TEXT NOT NULL, '
+            'library_movie_ids TEXT NOT NULL, '
+            'PRIMARY KEY (campaign, preferences))')
+        self._connection.commit()
+
+    def get_delivered(self, campaign):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT address FROM deliveries WHERE campaign = ? AND status = 'sent'", (campaign,)).fetchall()
+        return {address for (address,) in rows}
+
+    def record(self, campaign, address, status, attempts, error=None):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO deliveries (campaign, address, status, attempts, error, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (campaign, address, status, attempts, error, time.time()))
+            self._connection.commit()
+
+        return
+
+    def get_newsletters(self, campaign, preferences_list):
+        """Gets the newsletters already rendered for a campaign
+
+        Args:
+            campaign (str): Campaign id
+            preferences_list (iterable): Newsletter preferences to look up
+
+        Returns:
+            dict: Dictionary with the preferences as key and a (html, library movie ids) tuple as value,
+            preferences without stored newsletter are left out
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT preferences, html, library_movie_ids FROM newsletters WHERE campaign = ?',
+                (campaign,)).fetchall()
+        stored = {key: (html, json.loads(library_movie_ids)) for key, html, library_movie_ids in rows}
+
+        return {preferences: stored[json.dumps(preferences)] for preferences in preferences_list
+                if json.dumps(preferences) in stored}
+
+    def save_newsletters(self, campaign, newsletters):
+        """Stores the rendered newsletters of a campaign, newsletters stored before are kept
+
+        Args:
+            campaign (str): Campaign id
+            newsletters (dict): Dictionary with the preferences as key and a (html, library movie ids) tuple as value
+        """
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO newsletters (campaign, preferences, html, library_movie_ids) '
+                'VALUES (?, ?, ?, ?)',
+                [(campaign, json.dumps(preferences), html, json.dumps(list(library_movie_ids)))
+                 for preferences, (html, library_movie_ids) in newsletters.items()])
+            self._connection.commit()
+
+        return
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+        return
+
+async def _deliver_one(pool, receiver, mail_factory, semaphore, retries, backoff):
+    """Builds the mail of one receiver and sends it in a worker thread, retries with exponential backoff.
+    The mail string only exists while it is sent, so memory does not grow with the number of receivers.
+
+    Returns:
+        tuple: Number of attempts and the last exception, None if the mail was sent
+    """
+    async with semaphore:
+        mail_string = mail_factory.create_mail_str(receiver)
+        for attempt in range(retries + 1):
+            try:
+                await asyncio.to_thread(pool.send, receiver, mail_string)
+                return attempt + 1, None
+            except Exception as e:
+                error = e
+                logging.debug(f'Attempt {attempt + 1} for {receiver} failed: {e}')
+                if attempt < retries:
+                    await asyncio.sleep(backoff * 2 ** attempt)
+
+    return retries + 1, error
+
+async def deliver(mails, campaign, pool, ledger=None, concurrency=4, retries=3, backoff=2.0, batch_size=100):
+    """Delivers mails concurrently over a pool of SMTP sessions, batch by batch, and logs the throughput per batch
+
+    Args:
+        mails (list): List of (receiver, mail factory) tuples, see send_mails.MailFactory
+        campaign (str): Campaign id used in the ledger
+        pool (send_mails.SMTPSessionPool): Session pool, e.g. pointing to a local debugging server for tests
+        ledger (DeliveryLedger, optional): Ledger of delivered addresses, these are skipped
+        concurrency (int): Maximum number of mails sent at the same time
+        retries (int): Number of retries per recipient
+        backoff (float): Seconds waited before the first retry, doubled for every further retry
+        batch_size (int): Number of mails per batch
+
+    Returns:
+        dict: Summary with number of sent, skipped and failed mails, failed addresses, seconds and mails per second
+    """
+    delivered = ledger.get_delivered(campaign) if ledger is not None else set()
+    pending_mails = [(receiver, mail_factory) for receiver, mail_factory in mails if receiver not in delivered]
+
+    start_time = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deliver_and_record(receiver, mail_factory):
+        attempts, error = await _deliver_one(pool, receiver, mail_factory, semaphore, retries, backoff)
+        if ledger is not None:
+            status = 'sent' if error is None else 'failed'
+            await asyncio.to_thread(ledger.record, campaign, receiver, status, attempts,
+                                    None if error is None else str(error))
+        return receiver, error
+
+    results = []
+    for i in range(0, len(pending_mails), batch_size):
+        batch = pending_mails[i:i+batch_size]
+        batch_start_time = time.perf_counter()
+        batch_results = await asyncio.gather(*(deliver_and_record(receiver, mail_factory)
+                                               for receiver, mail_factory in batch))
+        batch_time = max(time.perf_counter() - batch_start_time, 1e-6)
+        num_failed = sum(error is not None for _, error in batch_results)
+        logging.info(f'Batch {i // batch_size + 1}: sent {len(batch) - num_failed} of {len(batch)} mails '
+                     f'in {batch_time:.1f}s ({len(batch) / batch_time:.1f} mails/s)')
+        results += batch_results
+    elapsed_time = max(time.perf_counter() - start_time, 1e-6)
+
+    failed = [receiver for receiver, error in results if error is not None]
+    summary = {
+        'sent': len(results) - len(failed),
+        'skipped': len(mails) - len(pending_mails),
+        'failed': len(failed),
+        'failed_addresses': failed,
+        'seconds': elapsed_time,
+        'mails_per_second': (len(results) - len(failed)) / elapsed_time,
+    }
+    logging.info(f"Campaign {campaign}: sent {summary['sent']}, skipped {summary['skipped']}, "
+                 f"failed {summary['failed']} in {elapsed_time:.1f}s ({summary['mails_per_second']:.1f} mails/s)")
+
+    return summary
+
+def deliver_newsletter(mails, campaign=None, ledger=None, concurrency=4, retries=3, backoff=2.0, **pool_kwargs):
+    """Runs the delivery engine with its own session pool
+
+    Args:
+        mails (list): List of (receiver, mail factory) tuples, see send_mails.MailFactory
+        campaign (str, optional): Campaign id, defaults to the current week
+        ledger (DeliveryLedger, optional): Ledger to skip and record delivered addresses, closed by the caller
+        pool_kwargs: Keyword arguments passed on to send_mails.SMTPSessionPool, e.g. host and port
+
+    Returns:
+        dict: Delivery summary, see deliver
+    """
+    campaign = campaign or get_campaign_id()
+    with send_mails.SMTPSessionPool(size=concurrency, **pool_kwargs) as pool:
+        summary = asyncio.run(deliver(mails, campaign, pool, ledger, concurrency, retries, backoff))
+
+    return summary
@@ -3,6 +3,8 @@ import os
 sys.path.append(os.environ.get('full_path'))
 from mailing import send_mails
 from mailing import create_mails
+from mailing import delivery
+from mailing import audience
 import logging
 from os import environ
 
@@ -16,27 +18,53 @@ def main(admin=False):
                     datefmt='%H:%M:%S',
                     level=logging.INFO)
     
-    # Get all mail adresses to send the newsletter to
+    # Get all mail adresses to send the newsletter to, grouped by their newsletter preferences
     if admin:
-        mail_adresses = [os.environ.get('admin_mail')]
+        preference_groups = {audience.DEFAULT_PREFERENCES: [os.environ.get('admin_mail')]}
     else:
-        mail_adresses = send_mails.get_mailing_list()
+        members = audience.AudienceFetcher().get_subscribed_members()
+        preference_groups = audience.group_by_preferences(members)
     
-    # Fill newsletter template with movies
-    template = open(os.environ.get('full_path') + "/templates/newsletter_template.html", "r").read()
-    updated_template = create_mails.update_newsletter_template(template)
-    
-    # Prepare mail
-    for mail_address in mail_adresses:
+    # Newsletters and delivered addresses of this week's campaign are kept in the ledger, except for admin runs
+    campaign = delivery.get_campaign_id()
+    ledger = None if admin else delivery.DeliveryLedger()
+    try:
+        # Fill newsletter template with movies, once per distinct preferences. Variants rendered by an earlier
+        # run of the campaign are reused, so a rerun sends the same newsletter to the remaining subscribers.
+        template = open(os.environ.get('full_path') + "/templates/newsletter_template.html", "r").read()
+        newsletters = {}
+        if ledger is not None:
+            newsletters = {preferences: create_mails.Newsletter(*newsletter) for preferences, newsletter
+                           in ledger.get_newsletters(campaign, preference_groups).items()}
+        missing_preferences = [preferences for preferences in preference_groups if preferences not in newsletters]
+        newsletters.update(create_mails.render_newsletter_variants(template, missing_preferences))
+        if ledger is not None:
+            ledger.save_newsletters(campaign, newsletters)
+        logging.info(f'Rendered {len(missing_preferences)} of {len(newsletters)} newsletter variants for '
+                     f'{sum(len(addresses) for addresses in preference_groups.values())} subscribers.')
+        
+        # Prepare one mail factory per variant, the mail of a receiver is only built when it is sent
         from_email = environ.get('mail_from')
-        to_email = mail_address
         subject = 'Check out this week\'s top movie releases 🍿'
-        mail = send_mails.create_mail_str(from_email, to_email, subject, updated_template)
-        try:
-            response = send_mails.send_mail(to_email, mail)
-            logging.info(f'Mail succesfully delivered to {mail_address}!')
-        except:
+        mails = []
+        for preferences, mail_adresses in preference_groups.items():
+            mail_factory = send_mails.MailFactory(from_email, subject, newsletters[preferences].html)
+            mails += [(mail_address, mail_factory) for mail_address in mail_adresses]
+        
+        # Send all mails concurrently, addresses already delivered to this week are skipped
+        summary = delivery.deliver_newsletter(mails, campaign, ledger, concurrency=4, retries=3, rate_limit=5)
+        for mail_address in summary['failed_addresses']:
             logging.info(f'Mail could not be sent to {mail_address}!')
+        
+        # Only now mark the library movies of the newsletters delivered to anyone as sent
+        if ledger is not None:
+            delivered = ledger.get_delivered(campaign)
+            create_mails.mark_library_movies_as_sent([newsletters[preferences] for preferences, mail_adresses
+                                                      in preference_groups.items()
+                                                      if delivered.intersection(mail_adresses)])
+    finally:
+        if ledger is not None:
+            ledger.close()
     return
 
 if __name__ == '__main__':
@@ -1,76 +1,172 @@
 import smtplib, ssl
+import threading
+import logging
+import queue
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formataddr
 from email.header import Header
-import mailchimp_marketing as MailchimpMarketing
 from os import environ
 
-def create_mail_str(mail_from, mail_to, subject, html_content):
-    """Construct mail string from input variables and html content
+class MailFactory:
+    """Builds and encodes the mail once, per recipient only the To header is swapped.
+    Personalization tokens like {{email}} in the html content are filled per recipient,
+    those mails are encoded when they are created and not kept.
+    """
 
-    Args:
-        mail_from (str): sender
-        mail_to (str): receiver
-        subject (str): subject 
-        html_content (str): str content
+    RECIPIENT_PLACEHOLDER = 'recipient-placeholder@moviemail.invalid'
 
-    Returns:
-        mail_string(str): Mail formatted as string
-    """
-    # Construct mail
-    mail_message = MIMEMultipart()
-    mail_message['From'] = formataddr((str(Header('MovieMail', 'utf-8')), mail_from))
-    mail_message['To'] = mail_to
-    mail_message['Subject'] = subject
-    
-    # Add body
-    mail_message.attach(MIMEText(html_content, 'html'))
-    
-    # Convert to string
-    mail_string = mail_message.as_string()
-    
-    return mail_string
-
-def send_mail(receiver, mail_string):
-    """Send mail via gmail
-
-    Args:
-        receiver (str): receiver mail adress
-        mail_string (str): mail formatted as string
+    def __init__(self, mail_from, subject, html_content):
+        """
+        Args:
+            mail_from (str): sender
+            subject (str): subject
+            html_content (str): str content
+        """
+        self.mail_from = mail_from
+        self.subject = subject
+        self.html_content = html_content
+        self._encoded_parts = None
+
+    def _encode(self, html_content):
+        """Encodes the mail with a placeholder recipient and splits it at the placeholder"""
+        # Construct mail
+        mail_message = MIMEMultipart()
+        mail_message['From'] = formataddr((str(Header('MovieMail', 'utf-8')), self.mail_from))
+        mail_message['To'] = self.RECIPIENT_PLACEHOLDER
+        mail_message['Subject'] = self.subject
+        
+        # Add body
+        mail_message.attach(MIMEText(html_content, 'html'))
+        
+        # Convert to string once, the placeholder only occurs in the To header
+        head, tail = mail_message.as_string().split(self.RECIPIENT_PLACEHOLDER, 1)
+        return head, tail
+
+    def create_mail_str(self, mail_to, tokens=None):
+        """Construct mail string for one recipient
+
+        Args:
+            mail_to (str): receiver
+            tokens (dict, optional): Personalization tokens, {{key}} in the html content is replaced by the value
+
+        Returns:
+            mail_string(str): Mail formatted as string
+        """
+        # Only the mail without tokens is kept, personalized mails are encoded per recipient and not stored
+        if tokens:
+            html_content = self.html_content
+            for key, value in sorted(tokens.items()):
+                html_content = html_content.replace('{{' + key + '}}', str(value))
+            encoded_parts = self._encode(html_content)
+        else:
+            if self._encoded_parts is None:
+                self._encoded_parts = self._encode(self.html_content)
+            encoded_parts = self._encoded_parts
+        
+        head, tail = encoded_parts
+        return head + mail_to + tail
+
+class SMTPSessionPool:
+    """Pool of authenticated SMTP sessions that are reused for many messages. Sessions are opened
+    on first use, reconnected after a drop and recycled after a maximum number of messages.
+    Sending is rate limited across all sessions of the pool.
     """
-    # Get environmental variables
-    mail_pw = environ.get('gmail_key')
-    
-    # Connect with gmail server 
-    context = ssl.create_default_context()
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-        mail_from = environ.get('mail_from')
-        server.login(mail_from, mail_pw)
-        response = server.sendmail(mail_from, receiver, mail_string)
-        return response
-    
-def get_mailing_list(list_id=''):
-    api_key = environ.get('mailchimp_api_key')
-
-    # Connect to client
-    client = MailchimpMarketing.Client()
-    client.set_config({"api_key": api_key,"server": "us21"})
-    
-    all_members = []
-    # If list_id specified, get members from that list id
-    if list_id:
-        response = client.lists.get_list_members_info(list_id)
-        for member in response['members']:
-            all_members.append(member['email_address'])
-    
-    # Get all members from all lists
-    else:
-        response = client.lists.get_all_lists()
-        for list in response['lists']:
-            list_id = list['id']
-            response = client.lists.get_list_members_info(list_id)
-            for member in response['members']:
-                all_members.append(member['email_address'])
-                
-    return all_members
\ No newline at end of file
+
+    def __init__(self, size=2, host=None, port=None, max_messages_per_session=100, rate_limit=None, use_ssl=None):
+        """
+        Args:
+            size (int): Maximum number of open sessions
+            host (str): SMTP host, defaults to gmail
+            port (int): SMTP port
+            max_messages_per_session (int): Number of messages after which a session is reconnected
+            rate_limit (float): Maximum number of messages per second, None for no limit
+            use_ssl (bool): Connect via SSL and log in (False e.g. for a local debugging server), defaults to
+            the smtp_use_ssl environment variable
+        """
+        self.size = size
+        self.host = host or environ.get('smtp_host', 'smtp.gmail.com')
+        self.port = int(port or environ.get('smtp_port', 465))
+        self.max_messages_per_session = max_messages_per_session
+        self.rate_limit = rate_limit
+        self.use_ssl = use_ssl if use_ssl is not None else environ.get('smtp_use_ssl', 'true').lower() != 'false'
+        self._sessions = queue.LifoQueue()
+        self._num_sessions = 0
+        self._lock = threading.Lock()
+        self._next_send_time = time.monotonic()
+        for _ in range(size):
+            self._sessions.put(None)
+
+    def _connect(self):
+        if self.use_ssl:
+            context = ssl.create_default_context()
+            server = smtplib.SMTP_SSL(self.host, self.port, context=context)
+            server.login(environ.get('mail_from'), environ.get('gmail_key'))
+        else:
+            server = smtplib.SMTP(self.host, self.port)
+        return {'server': server, 'messages_sent': 0}
+
+    def _disconnect(self, session):
+        try:
+            session['server'].quit()
+        except Exception:
+            pass
+
+    def _wait_for_rate_limit(self):
+        if not self.rate_limit:
+            return
+        with self._lock:
+            send_time = max(self._next_send_time, time.monotonic())
+            self._next_send_time = send_time + 1 / self.rate_limit
+        time.sleep(max(0, send_time - time.monotonic()))
+
+    def send(self, receiver, mail_string):
+        """Sends one mail on a pooled session, reconnects once if the session dropped
+
+        Args:
+            receiver (str): receiver mail adress
+            mail_string (str): mail formatted as string
+
+        Returns:
+            dict: Refused recipients as returned by smtplib
+        """
+        session = self._sessions.get()
+        try:
+            if session is None or session['messages_sent'] >= self.max_messages_per_session:
+                if session is not None:
+                    self._disconnect(session)
+                session = None
+                session = self._connect()
+            self._wait_for_rate_limit()
+            mail_from = environ.get('mail_from')
+            try:
+                response = session['server'].sendmail(mail_from, receiver, mail_string)
+            except (smtplib.SMTPServerDisconnected, ConnectionError, ssl.SSLError):
+                logging.debug('SMTP session dropped, reconnecting...')
+                self._disconnect(session)
+                session = None
+                session = self._connect()
+                response = session['server'].sendmail(mail_from, receiver, mail_string)
+            session['messages_sent'] += 1
+            return response
+        finally:
+            self._sessions.put(session)
+
+    def close(self):
+        """Closes all open sessions of the pool"""
+        sessions = []
+        while not self._sessions.empty():
+            sessions.append(self._sessions.get())
+        for session in sessions:
+            if session is not None:
+                self._disconnect(session)
+            self._sessions.put(None)
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,133 @@
+import functools
+import re
+from bs4 import BeautifulSoup
+from bs4.formatter import HTMLFormatter
+from crawler import normalization
+
+# Streaming services that have a table in the newsletter
+PROVIDERS = ['Amazon Prime Video', 'Netflix']
+DISCLAIMER = "Added from provider's existing library as not enough good movies were released this week"
+
+# Same output formatter as prettify(formatter='html'), i.e. named html entities
+FORMATTER = HTMLFormatter.REGISTRY['html']
+SLOT_PATTERN = re.compile(r'^( *)@@slot-(\d+)@@\n', re.MULTILINE)
+
+
+def _text_line(indent, value):
+    # prettify strips strings after substituting entities and leaves out empty ones
+    text = FORMATTER.substitute(str(value)).strip()
+    return f'{indent}{text}\n' if text else ''
+
+def _attribute(value):
+    return FORMATTER.quoted_attribute_value(FORMATTER.attribute_value(str(value)))
+
+def _render_cell(indent, value):
+    return f'{indent}<td>\n{_text_line(indent + " ", value)}{indent}</td>\n'
+
+def render_movie_row(indent, movie):
+    """Renders a row of a provider table the way prettify prints it
+
+    Args:
+        indent (str): Indentation of the row
+        movie (dict): Movie with name, imdb_rating, release_year, runtime and flatrate_link
+
+    Returns:
+        str: Row markup
+    """
+    cell_indent = indent + ' '
+    content_indent = cell_indent + ' '
+
+    # Add name (add asterisk if top movie)
+    name = _text_line(content_indent, movie['name'])
+    if 'top_movie' in movie:
+        name += (f'{content_indent}<sup class="asterisk">\n{content_indent} *\n{content_indent}</sup>\n')
+
+    return (f'{indent}<tr>\n'
+            f'{cell_indent}<td>\n{name}{cell_indent}</td>\n'
+            + _render_cell(cell_indent, movie['imdb_rating'])
+            + _render_cell(cell_indent, movie['release_year'])
+            + _render_cell(cell_indent, normalization.format_runtime(movie['runtime']))
+            + f'{cell_indent}<td>\n'
+            f'{content_indent}<a href={_attribute(movie["flatrate_link"])}>\n'
+            f'{content_indent} Link\n'
+            f'{content_indent}</a>\n'
+            f'{cell_indent}</td>\n'
+            f'{indent}</tr>\n')
+
+def render_disclaimer(indent):
+    return f'{indent}<sup>\n{indent} *\n{indent}</sup>\n' + _text_line(indent, DISCLAIMER)
+
+def remove_provider_section(provider_table):
+    """Removes the row of a provider table and the row of the provider logo above it"""
+    logo = provider_table.find_previous('img')
+    provider_table.find_parent('tr').decompose()
+    # The logo is in a nested table, its row in the column is the second row above it
+    if logo is not None and len(logo.find_parents('tr')) > 1:
+        logo.find_parents('tr')[1].decompose()
+
+    return
+
+class CompiledNewsletterTemplate:
+    """Newsletter template that is parsed and prettified once.
+    The prettified template is split into static segments around the provider tables and the disclaimer,
+    rendering only joins the segments with the rows of the movies. The output is identical to
+    inserting the movies with insert_mail_content and prettifying the soup.
+    """
+
+    def __init__(self, template, providers=PROVIDERS):
+        """
+        Args:
+            template (str): Template html
+            providers (list): Streaming services that get a table, the sections of the others are removed
+        """
+        soup = BeautifulSoup(template, features='html.parser')
+
+        # Remove the table and logo of providers that are not used
+        for provider_table in soup.find_all('table', {'class': 'movie_table'}):
+            if provider_table.get('id', '').removesuffix(' table') not in providers:
+                remove_provider_section(provider_table)
+
+        # Mark the end of each provider table and the disclaimer with a slot
+        slot_names = []
+        for provider in providers:
+            provider_table = soup.find('table', {'id': f'{provider} table'})
+            if provider_table is not None:
+                provider_table.append(f'@@slot-{len(slot_names)}@@')
+                slot_names.append(provider)
+        disclaimer = soup.find('div', {'class': 'asterisk_placeholder'})
+        if disclaimer is not None:
+            disclaimer.append(f'@@slot-{len(slot_names)}@@')
+            slot_names.append(None)
+
+        # Split into static segments and (indentation, slot name) pairs
+        parts = SLOT_PATTERN.split(soup.prettify(formatter='html'))
+        self.segments = parts[::3]
+        self.slots = [(indent, slot_names[int(slot)]) for indent, slot in zip(parts[1::3], parts[2::3])]
+
+    def render(self, movie_dict):
+        """Fills the provider tables with the movies
+
+        Args:
+            movie_dict (dict): Dictionary with the provider as key and the list of movies as value
+
+        Returns:
+            str: Prettified newsletter html
+        """
+        providers = [provider for _, provider in self.slots if provider is not None]
+        has_top_movie = any('top_movie' in movie for provider in providers for movie in movie_dict.get(provider, []))
+
+        pieces = [self.segments[0]]
+        for (indent, provider), segment in zip(self.slots, self.segments[1:]):
+            if provider is None:
+                if has_top_movie:
+                    pieces.append(render_disclaimer(indent))
+            else:
+                pieces += [render_movie_row(indent, movie) for movie in movie_dict.get(provider, [])]
+            pieces.append(segment)
+
+        return ''.join(pieces)
+
+@functools.lru_cache(maxsize=32)
+def compile_template(template, providers=tuple(PROVIDERS)):
+    """Returns the compiled template, compiled once per process, template and combination of providers"""
+    return CompiledNewsletterTemplate(template, providers)